@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Sequence
+from dataclasses import dataclass
+from datetime import timedelta
+
+from companion_client.model.chat import (
+    ChatStreamingMaterialResponse,
+    ChatStreamingRequest,
+    ChatStreamingResponse,
+    ChatStreamingSourcesResponse,
+    StreamingResponseType,
+)
+from companion_client.model.group import MaterialGroup
+
+# Request fields that shape the answer; identities and the message itself are handled separately
+REQUEST_SETTINGS = ("use_history_summarization", "max_history", "max_question_suggestion_history",
+                    "max_question_suggestions", "max_topic_suggestion_history", "max_topic_suggestions",
+                    "max_sources_context", "max_sources_display", "max_slots")
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?!.。,;:]+$")
+
+
+def normalize_message(message: str) -> str:
+    """ Case, Unicode form, whitespace and trailing punctuation do not change the question """
+    message = unicodedata.normalize("NFKC", message).casefold()
+    return _TRAILING.sub("", _WHITESPACE.sub(" ", message).strip())
+
+
+def referenced_qids(event: ChatStreamingResponse) -> set[str]:
+    if isinstance(event, ChatStreamingSourcesResponse):
+        return {c.qid for c in event.value if c.qid is not None}
+    if isinstance(event, ChatStreamingMaterialResponse):
+        return {q for v in event.value for q in (v.qids if isinstance(v, MaterialGroup) else [v.qid])}
+    return set()
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    course: str
+    semester: str
+    events: Sequence[ChatStreamingResponse]
+    offsets: Sequence[float]
+    """ Seconds since the request was sent, per event """
+    qids: frozenset[str]
+    expires: float
+
+
+class AnswerCache:
+    """
+    Complete event sequences of answered chat requests, keyed on course, semester,
+    normalized message and the course and request settings.
+
+    Answers do not take a thread's history into account, so only enable the cache
+    for traffic where that is acceptable or restrict it with cacheable.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours=6), max_entries: int = 10_000,
+                 cacheable: Callable[[ChatStreamingRequest], bool] = lambda _: True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl.total_seconds()
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._by_qid: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(request: ChatStreamingRequest) -> str:
+        h = hashlib.sha256()
+        for part in (request.course, request.semester, normalize_message(request.message),
+                     request.course_desc.model_dump_json(),
+                     request.model_dump_json(include=set(REQUEST_SETTINGS))):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, request: ChatStreamingRequest) -> CachedAnswer | None:
+        if not self.cacheable(request):
+            return None
+        key = self.key(request)
+        answer = self._entries.get(key)
+        if answer is not None and answer.expires <= self._clock():
+            self._remove(key)
+            answer = None
+        if answer is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return answer
+
+    def put(self, request: ChatStreamingRequest, events: Sequence[ChatStreamingResponse],
+            offsets: Sequence[float]) -> None:
+        """ Stores a complete answer; incomplete or failed ones are ignored """
+        if not self.cacheable(request) or not events or events[-1].type != StreamingResponseType.END:
+            return
+        if any(e.type == StreamingResponseType.ERROR for e in events) or not getattr(events[-1], "full_answer", True):
+            return
+        key = self.key(request)
+        self._remove(key)
+        qids = frozenset(q for e in events for q in referenced_qids(e))
+        self._entries[key] = CachedAnswer(request.course, request.semester, tuple(events), tuple(offsets),
+                                          qids, self._clock() + self.ttl)
+        for qid in qids:
+            self._by_qid.setdefault(qid, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, course: str | None = None, semester: str | None = None,
+                   qid: str | None = None) -> int:
+        """
+        Drops answers referencing a material (qid), or all answers of a course
+        (and semester). Without arguments, drops everything. Returns the number dropped.
+        """
+        if qid is not None:
+            keys = list(self._by_qid.get(qid, ()))
+        else:
+            keys = [k for k, a in self._entries.items()
+                    if (course is None or a.course == course) and (semester is None or a.semester == semester)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        answer = self._entries.pop(key, None)
+        if answer is None:
+            return
+        for qid in answer.qids:
+            keys = self._by_qid[qid]
+            keys.discard(key)
+            if not keys:
+                del self._by_qid[qid]
+
+    @staticmethod
+    async def replay(answer: CachedAnswer, pace: float | None = None) -> AsyncIterator[ChatStreamingResponse]:
+        """
+        Yields the recorded events. With pace, the recorded timing is reproduced
+        scaled by that factor (0.5 replays twice as fast); otherwise without delay.
+        """
+        start = time.monotonic()
+        for event, offset in zip(answer.events, answer.offsets):
+            if pace:
+                delay = start + offset * pace - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield event
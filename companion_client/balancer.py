@@ -0,0 +1,115 @@
+import hashlib
+import random
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+
+@dataclass
+class Endpoint:
+    url: str
+    ewma: float = 0.0
+    """ Smoothed latency in seconds, 0 until the first response """
+    inflight: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    requests: int = 0
+    failures: int = 0
+
+    def cost(self) -> float:
+        return self.ewma * (self.inflight + 1)
+
+    def join(self, path: str) -> str:
+        return f"{self.url.rstrip('/')}/{path.lstrip('/')}"
+
+
+class LoadBalancer:
+    """
+    Spreads requests over replicas of the API.
+
+    pick() chooses the cheaper of two random healthy endpoints, the cost being the
+    EWMA latency times the requests in flight (power of two choices). A failed request
+    enters the EWMA as taking at least failure_latency, so that a replica answering
+    errors quickly does not look fast. pin(key) maps
+    a key to a fixed healthy endpoint by rendezvous hashing, so that a key only moves
+    when its endpoint is ejected.
+
+    Health is checked passively: after failure_threshold consecutive failures an
+    endpoint is ejected for ejection_time, doubled on every repeated ejection (up to
+    max_ejection_time). At most max_ejected_fraction of the endpoints are ejected at
+    any time; if all are ejected, all are used.
+    """
+
+    def __init__(self, urls: Sequence[str], alpha: float = 0.3, failure_threshold: int = 5,
+                 ejection_time: timedelta = timedelta(seconds=30),
+                 max_ejection_time: timedelta = timedelta(minutes=5),
+                 max_ejected_fraction: float = 0.5,
+                 failure_latency: timedelta = timedelta(seconds=1),
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random | None = None):
+        if not urls:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time.total_seconds()
+        self.max_ejection_time = max_ejection_time.total_seconds()
+        self.max_ejected_fraction = max_ejected_fraction
+        self.failure_latency = failure_latency.total_seconds()
+        self.retries = 0
+        self._clock = clock
+        self._rng = rng or random.Random()
+
+    def healthy(self) -> list[Endpoint]:
+        now = self._clock()
+        healthy = [e for e in self.endpoints if e.ejected_until <= now]
+        return healthy or self.endpoints
+
+    def pick(self, exclude: Endpoint | None = None) -> Endpoint:
+        """ A cheap healthy endpoint other than exclude, if there is another one """
+        healthy = self.healthy()
+        if exclude is not None and len(self.endpoints) > 1:
+            healthy = [e for e in healthy if e is not exclude] or [e for e in self.endpoints if e is not exclude]
+        if len(healthy) == 1:
+            return healthy[0]
+        a, b = self._rng.sample(healthy, 2)
+        return a if a.cost() <= b.cost() else b
+
+    def pin(self, key: str) -> Endpoint:
+        def weight(e: Endpoint) -> bytes:
+            return hashlib.blake2b(f"{e.url}\0{key}".encode(), digest_size=8).digest()
+        return max(self.healthy(), key=weight)
+
+    def observe(self, endpoint: Endpoint, latency: float, ok: bool) -> None:
+        """ Records the outcome of a request sent to endpoint """
+        endpoint.requests += 1
+        if not ok:
+            latency = max(latency, self.failure_latency)
+        endpoint.ewma = latency if endpoint.ewma == 0 else self.alpha * latency + (1 - self.alpha) * endpoint.ewma
+        if ok:
+            endpoint.consecutive_failures = 0
+            if endpoint.ejected_until <= self._clock():
+                endpoint.ejections = 0
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            self._eject(endpoint)
+
+    def _eject(self, endpoint: Endpoint) -> None:
+        now = self._clock()
+        if endpoint.ejected_until > now:
+            return
+        ejected = sum(e.ejected_until > now for e in self.endpoints)
+        if ejected + 1 > self.max_ejected_fraction * len(self.endpoints):
+            return
+        endpoint.ejected_until = now + min(self.max_ejection_time, self.ejection_time * 2 ** endpoint.ejections)
+        endpoint.ejections += 1
+        endpoint.consecutive_failures = 0
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        now = self._clock()
+        return [{"url": e.url, "ewma": e.ewma, "inflight": e.inflight, "requests": e.requests,
+                 "failures": e.failures, "ejected": e.ejected_until > now} for e in self.endpoints]
@@ -0,0 +1,60 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """
+    Collects the keys requested within one event loop tick (or within window
+    seconds of the first request) and loads each distinct key once.
+
+    The API has no batch endpoints, so a batch is sent as a burst of parallel
+    single-key requests, with at most concurrency requests in flight per loader.
+    Every caller receives the result or the exception for its key.
+    """
+
+    def __init__(self, load: Callable[[K], Awaitable[V]], window: float = 0, concurrency: int = 16):
+        self._load = load
+        self.window = window
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: dict[K, asyncio.Future[V]] = {}
+        self._handle: asyncio.Handle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.requested = 0
+        self.loaded = 0
+
+    async def load(self, key: K) -> V:
+        self.requested += 1
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            if self._handle is None:
+                self._handle = (loop.call_soon(self._dispatch) if self.window <= 0
+                                else loop.call_later(self.window, self._dispatch))
+        # A cancelled caller must not cancel the load for the others waiting on the key
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        batch, self._pending, self._handle = self._pending, {}, None
+        self.batches += 1
+        self.loaded += len(batch)
+        for key, future in batch.items():
+            task = asyncio.create_task(self._run(key, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: K, future: asyncio.Future[V]) -> None:
+        try:
+            async with self._semaphore:
+                value = await self._load(key)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(value)
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Protocol
+
+
+class CacheBackend(Protocol):
+    """ Stores serialized responses by key, each tagged with what it depends on """
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        """ Deletes the entries carrying any of tags, returns how many """
+        ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryCache:
+    """ Per-process cache, least recently used entries are evicted beyond max_bytes """
+
+    def __init__(self, max_bytes: int = 64 << 20, clock: Callable[[], float] = time.time):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[bytes, float, frozenset[str]]] = OrderedDict()
+        self._tagged: dict[str, set[str]] = {}
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= self._clock():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        self.delete(key)
+        tags = frozenset(tags)
+        self._entries[key] = (value, self._clock() + ttl, tags)
+        for t in tags:
+            self._tagged.setdefault(t, set()).add(key)
+        self.size += len(value)
+        while self.size > self.max_bytes and self._entries:
+            self.delete(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry[0])
+        for t in entry[2]:
+            keys = self._tagged[t]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[t]
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        keys = set().union(*(self._tagged.get(t, ()) for t in tags))
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tagged.clear()
+        self.size = 0
+
+
+class SQLiteCache:
+    """
+    Cache shared by all processes on a node through an SQLite database in WAL mode.
+
+    Readers never block and are never blocked by the single writer. Entries are
+    replaced atomically by an upsert. The total size and the tags of the entries are
+    maintained by triggers; beyond max_bytes expired entries and then the oldest
+    stored entries are evicted.
+
+    get and set run on the caller's thread, so they wait at most timeout seconds for
+    a lock held by another process; a contended get is a miss and a contended set is
+    skipped (counted in busy), instead of stalling the event loop.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires REAL NOT NULL,
+            stored REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_stored ON entries (stored);
+        CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+        INSERT OR IGNORE INTO usage VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+            BEGIN UPDATE usage SET size = size + new.size; END;
+        CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries
+            BEGIN UPDATE usage SET size = size + new.size - old.size; END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+            BEGIN UPDATE usage SET size = size - old.size; END;
+        CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))
+            WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+        CREATE TRIGGER IF NOT EXISTS entries_delete_tags AFTER DELETE ON entries
+            BEGIN DELETE FROM tags WHERE key = old.key; END;
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 512 << 20, clock: Callable[[], float] = time.time,
+                 timeout: float = 0.05):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.busy = 0
+        self._clock = clock
+        self._local = threading.local()
+        db = self._connection()
+        db.execute("PRAGMA busy_timeout = 30000")
+        db.executescript(self.SCHEMA)
+        db.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """ One connection per thread and process; connections must not cross a fork """
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            row = self._connection().execute("SELECT value FROM entries WHERE key = ? AND expires > ?",
+                                             (key, self._clock())).fetchone()
+        except sqlite3.OperationalError:
+            self.busy += 1
+            return None
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        try:
+            self._set(key, value, ttl, tags)
+        except sqlite3.OperationalError:
+            self.busy += 1
+
+    def _set(self, key: str, value: bytes, ttl: float, tags: Iterable[str]) -> None:
+        now = self._clock()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("""INSERT INTO entries (key, value, size, expires, stored) VALUES (?, ?, ?, ?, ?)
+                          ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,
+                                                          expires = excluded.expires, stored = excluded.stored""",
+                       (key, value, len(value), now + ttl, now))
+            db.execute("DELETE FROM tags WHERE key = ?", (key,))
+            db.executemany("INSERT INTO tags (tag, key) VALUES (?, ?)", ((t, key) for t in set(tags)))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if self.size > self.max_bytes:
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+            while self.size > self.max_bytes:
+                deleted = db.execute("""DELETE FROM entries WHERE key IN
+                                        (SELECT key FROM entries ORDER BY stored LIMIT 16)""").rowcount
+                if not deleted:
+                    break
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    @property
+    def size(self) -> int:
+        return self._connection().execute("SELECT size FROM usage").fetchone()[0]
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        if not tags:
+            return 0
+        return self._connection().execute(
+            f"DELETE FROM entries WHERE key IN (SELECT key FROM tags WHERE tag IN ({', '.join('?' * len(tags))}))",
+            tags).rowcount
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM entries")
+
+    def close(self) -> None:
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import re
+import time
+from collections.abc import AsyncIterator, Callable, Mapping
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Literal
+
+import httpx
+from pydantic import BaseModel, ValidationError
+
+from companion_client.answer_cache import AnswerCache
+from companion_client.model.course_structure import CourseInstanceSlot
+from companion_client.model.material import Material
+from companion_client.resolver import MaterialResolver
+from companion_client.search import SearchIndex
+from companion_client.timeline import SlotTimeline
+
+if TYPE_CHECKING:
+    from companion_client.balancer import Endpoint
+    from companion_client.client import CompanionClient
+
+type CourseKey = tuple[str, str]
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeEvent(BaseModel, frozen=True):
+    seq: int
+    kind: Literal["material", "slot", "course"]
+    action: Literal["updated", "deleted"] = "updated"
+    qid: str | None = None
+    slot_id: int | None = None
+    course: str | None = None
+    semester: str | None = None
+    data: Mapping[str, Any] | None = None
+    """ The new material or slot, if the server sends it along """
+
+
+MATERIAL_PATH = re.compile(r"/material/(cis?)/([0-9]+)")
+SLOT_PATH = re.compile(r"/slots/([0-9]+)")
+SLOT_MATERIALS_PATH = re.compile(r"/materials/([0-9]+)(/.*)?")
+SLOTS_PATH = re.compile(r"/slots/([^/]+)/[^/]+(/.*)?")
+GROUPED_PATH = re.compile(r"/grouped/by-[^/]+/(?:[^/]+/)?([^/]+)/[^/]+")
+COURSE_PATH = re.compile(r"/(?:course|topics|sections)/([^/]+)(/.*)?")
+
+
+def cache_tags(path: str, params: Mapping[str, Any] = {}) -> set[str]:
+    """
+    Tags of a cached GET response, naming what a change event must invalidate:
+    the material qid, "slot:<id>", "course:<course>" for anything belonging to a
+    course, "materials"/"slots" (optionally ":<course>") for lists of them, and
+    the path for anything else (e.g. "courses").
+    """
+    path = "/" + path.lstrip("/")
+    if m := MATERIAL_PATH.fullmatch(path):
+        return {f"{m[1]}:{m[2]}"}
+    if m := SLOT_PATH.fullmatch(path):
+        return {f"slot:{m[1]}"}
+    if m := SLOT_MATERIALS_PATH.fullmatch(path):
+        return {f"slot:{m[1]}", "materials", "slot-materials"}
+    if m := SLOTS_PATH.fullmatch(path):
+        return {f"course:{m[1]}", "slots", f"slots:{m[1]}"}
+    if m := GROUPED_PATH.fullmatch(path):
+        return {f"course:{m[1]}", "materials", f"materials:{m[1]}"}
+    if path == "/materials":
+        course = params.get("course")
+        return {"materials"} | ({f"course:{course}", f"materials:{course}"} if course else set())
+    if m := COURSE_PATH.fullmatch(path):
+        return {f"course:{m[1]}"}
+    return {path.strip("/")}
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[dict[str, str]]:
+    """ Server-sent events as dicts of their fields, multi-line data joined by newlines """
+    event: dict[str, str] = {}
+    async for line in lines:
+        if not line:
+            if "data" in event:
+                yield event
+            event = {}
+            continue
+        if line.startswith(":"):
+            continue
+        name, _, value = line.partition(":")
+        value = value.removeprefix(" ")
+        event[name] = f"{event[name]}\n{value}" if name == "data" and "data" in event else value
+    if "data" in event:
+        yield event
+
+
+class ChangeSubscription:
+    """
+    Follows the change feed of the API (server-sent events at path) and invalidates
+    what an event affects: the client's cached responses by tag, the answer cache,
+    the resolver, and the timelines and search indexes registered by (course, semester).
+    Materials and slots sent along with an event are patched in instead of dropped
+    where possible. Malformed events are skipped and counted in skipped; run() logs
+    and counts in errors events that fail to apply, and carries on with the next.
+
+    With several replicas the feed is opened on one picked by the client's
+    LoadBalancer, which is told whether connecting succeeded. After a disconnect the
+    feed is resumed with since=<last seq> on another replica, waiting retry, doubled
+    up to max_retry while reconnects keep failing.
+    """
+
+    def __init__(self, client: "CompanionClient", path: str = "/changes", since: int = 0,
+                 answer_cache: AnswerCache | None = None, resolver: MaterialResolver | None = None,
+                 timelines: Mapping[CourseKey, SlotTimeline] | None = None,
+                 indexes: Mapping[CourseKey, SearchIndex] | None = None,
+                 retry: timedelta = timedelta(seconds=1), max_retry: timedelta = timedelta(minutes=1)):
+        self.client = client
+        self.path = path
+        self.seq = since
+        self.answer_cache = answer_cache
+        self.resolver = resolver
+        self.timelines = dict(timelines or {})
+        self.indexes = dict(indexes or {})
+        self.retry = retry.total_seconds()
+        self.max_retry = max_retry.total_seconds()
+        self.reconnects = 0
+        self.skipped = 0
+        self.errors = 0
+        self._listeners: list[Callable[[ChangeEvent], None]] = []
+        self._task: asyncio.Task | None = None
+
+    def add_listener(self, listener: Callable[[ChangeEvent], None]) -> None:
+        self._listeners.append(listener)
+
+    async def events(self) -> AsyncIterator[ChangeEvent]:
+        """ Change events in order, reconnecting as needed """
+        delay = self.retry
+        endpoint: "Endpoint | None" = None
+        while True:
+            balancer = self.client.balancer
+            if balancer is not None:
+                endpoint = balancer.pick(exclude=endpoint)
+            start, connected = time.monotonic(), False
+            try:
+                async with self.client.client.stream(
+                        "GET", endpoint.join(self.path) if endpoint is not None else self.path,
+                        params={"since": self.seq}, timeout=None,
+                        headers={"Accept": "text/event-stream", "Last-Event-ID": str(self.seq)}) as r:
+                    connected = True
+                    if endpoint is not None:
+                        balancer.observe(endpoint, time.monotonic() - start, r.status_code < 500)
+                    r.raise_for_status()
+                    async for sse in iter_sse(r.aiter_lines()):
+                        if "retry" in sse and sse["retry"].isdigit():
+                            self.retry = int(sse["retry"]) / 1000
+                        try:
+                            event = ChangeEvent.model_validate_json(sse["data"])
+                        except ValidationError:
+                            self.skipped += 1
+                            continue
+                        if event.seq <= self.seq:
+                            continue
+                        self.seq = event.seq
+                        delay = self.retry
+                        yield event
+            except httpx.TransportError:
+                if endpoint is not None and not connected:
+                    balancer.observe(endpoint, time.monotonic() - start, False)
+            except httpx.HTTPError:
+                pass
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(self.max_retry, delay * 2)
+
+    def _invalidate(self, *tags: str) -> None:
+        # Tags are stored with the entries, so entries filled by other processes go as well
+        if self.client.cache is not None:
+            self.client.cache.delete_tagged(tags)
+
+    def _model[M: BaseModel](self, model: type[M], event: ChangeEvent) -> M | None:
+        """ The object sent along with event, None if there is none or it is malformed """
+        if not event.data or event.action != "updated":
+            return None
+        try:
+            return model.model_validate(event.data)
+        except ValidationError:
+            self.skipped += 1
+            return None
+
+    @staticmethod
+    def _targets[T](targets: dict[CourseKey, T], course: str | None, semester: str | None) -> list[T]:
+        return [t for (c, s), t in targets.items()
+                if (course is None or c == course) and (semester is None or s == semester)]
+
+    def apply(self, event: ChangeEvent) -> None:
+        match event.kind:
+            case "material":
+                self._material_changed(event)
+            case "slot":
+                self._slot_changed(event)
+            case "course":
+                if event.course:
+                    self._invalidate(f"course:{event.course}", "courses")
+                elif self.client.cache is not None:
+                    self.client.cache.clear()
+                if self.answer_cache is not None:
+                    self.answer_cache.invalidate(event.course, event.semester)
+        for listener in self._listeners:
+            listener(event)
+
+    def _material_changed(self, event: ChangeEvent) -> None:
+        material = self._model(Material, event)
+        qid = material.qid if material is not None else event.qid
+        course = material.course if material is not None else event.course
+        semester = material.semester if material is not None else event.semester
+        # Lists of a slot's materials are tagged by slot, not by course
+        self._invalidate(*filter(None, (qid, f"materials:{course}" if course else "materials",
+                                        f"slot:{event.slot_id}" if event.slot_id else "slot-materials")))
+        if qid is None:
+            return
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(qid=qid)
+        if self.resolver is not None:
+            if material is not None:
+                self.resolver.put(material)
+            else:
+                self.resolver.invalidate(qid)
+        for index in self._targets(self.indexes, course, semester):
+            index.remove(qid)
+            if material is not None:
+                index.add_material(material)
+
+    def _slot_changed(self, event: ChangeEvent) -> None:
+        slot = self._model(CourseInstanceSlot, event)
+        slot_id = slot.id if slot is not None else event.slot_id
+        course = slot.course if slot is not None else event.course
+        semester = slot.semester if slot is not None else event.semester
+        self._invalidate(f"slot:{slot_id}", f"slots:{course}" if course else "slots")
+        for timeline in self._targets(self.timelines, course, semester):
+            if slot is not None:
+                timeline.upsert(slot)
+            elif slot_id is not None:
+                timeline.remove(slot_id)
+
+    async def run(self) -> None:
+        async for event in self.events():
+            try:
+                self.apply(event)
+            except Exception:
+                # E.g. a failing listener or a locked cache database; the feed goes on
+                self.errors += 1
+                logger.exception("Failed to apply change event %d", event.seq)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,18 +1,109 @@
+import time
+from collections.abc import Sequence
 from typing import AsyncIterator
 from httpx_ws import aconnect_ws
 
-from companion_client.model.chat import ChatStreamingRequest, ChatStreamingResponse
+from companion_client.answer_cache import AnswerCache
+from companion_client.balancer import LoadBalancer
+from companion_client.compression import WS_DEFLATE_OFFER, CompressionStats, deflate_session
+from companion_client.model.chat import ChatStreamingRequest, ChatStreamingResponse, StreamingResponseType
+from companion_client.resolver import MaterialResolver
+from companion_client.traffic import TrafficRecorder
 
 
 class CompanionChatClient:
-    def __init__(self, base_url: str):
-        self.base_url = base_url
+    def __init__(self, base_url: str | Sequence[str], compression: bool = True,
+                 compression_stats: CompressionStats | None = None,
+                 answer_cache: AnswerCache | None = None, replay_pace: float | None = None,
+                 recorder: TrafficRecorder | None = None,
+                 resolver: MaterialResolver | None = None):
+        """
+        With several base URLs, every chat thread is pinned to one replica by its
+        thread_id; threads of a failing replica move to the remaining ones.
+        With compression, permessage-deflate is offered on the chat WebSocket.
+        With an answer_cache, repeated questions are replayed from the cache,
+        paced by replay_pace (see AnswerCache.replay).
+        A recorder captures every chat request for later replay, including answer cache hits.
+        With a resolver, materials referenced by SOURCES and MATERIALS events are
+        fetched while the answer streams and are cached in the resolver by the
+        time END is yielded.
+        """
+        urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.base_url = urls[0]
+        self.balancer = LoadBalancer(urls) if len(urls) > 1 else None
+        self.compression = compression
+        self.compression_stats = compression_stats if compression_stats is not None else CompressionStats()
+        self._session_class = deflate_session(self.compression_stats)
+        self.answer_cache = answer_cache
+        self.replay_pace = replay_pace
+        self.recorder = recorder
+        self.resolver = resolver
 
-    async def chat(self, request: ChatStreamingRequest) -> AsyncIterator[ChatStreamingResponse]:        
-        async with aconnect_ws(f"{self.base_url}/chat/ws") as ws:
-            await ws.send_text(request.model_dump_json())
-            while True:
-                message = await ws.receive_text()
-                rsp = ChatStreamingResponse.model_validate_json(message)
-                yield rsp
+    async def chat(self, request: ChatStreamingRequest) -> AsyncIterator[ChatStreamingResponse]:
+        referenced: set[str] = set()
+        if self.answer_cache is not None:
+            answer = self.answer_cache.get(request)
+            if answer is not None:
+                start = time.monotonic()
+                at = self.recorder.now() if self.recorder is not None else 0.0
+                ttft, count = None, 0
+                try:
+                    async for rsp in self.answer_cache.replay(answer, self.replay_pace):
+                        count += 1
+                        if ttft is None and rsp.type == StreamingResponseType.STREAMING:
+                            ttft = time.monotonic() - start
+                        if self.resolver is not None:
+                            referenced |= self.resolver.observe(rsp)
+                            if rsp.type == StreamingResponseType.END:
+                                await self.resolver.wait(referenced)
+                        yield rsp
+                finally:
+                    if self.recorder is not None:
+                        self.recorder.record_chat(at, request, ttft, count, 0, cached=True)
+                return
 
+        kwargs = {}
+        if self.compression:
+            kwargs = dict(headers={"Sec-WebSocket-Extensions": WS_DEFLATE_OFFER},
+                          session_class=self._session_class)
+        events: list[ChatStreamingResponse] = []
+        offsets: list[float] = []
+        start = time.monotonic()
+        at = self.recorder.now() if self.recorder is not None else 0.0
+        ttft: float | None = None
+        count, size, complete = 0, 0, False
+        endpoint = self.balancer.pin(request.thread_id) if self.balancer is not None else None
+        base_url = endpoint.url if endpoint is not None else self.base_url
+        try:
+            async with aconnect_ws(f"{base_url}/chat/ws", **kwargs) as ws:
+                await ws.send_text(request.to_json())
+                while True:
+                    message = await ws.receive_text()
+                    self.compression_stats.websocket.responses += 1
+                    self.compression_stats.websocket.decoded_bytes += len(message.encode())
+                    rsp = ChatStreamingResponse.parse(message)
+                    count += 1
+                    size += len(message)
+                    if ttft is None and rsp.type == StreamingResponseType.STREAMING:
+                        ttft = time.monotonic() - start
+                    if self.answer_cache is not None:
+                        events.append(rsp)
+                        offsets.append(time.monotonic() - start)
+                    if self.resolver is not None:
+                        referenced |= self.resolver.observe(rsp)
+                        if rsp.type == StreamingResponseType.END:
+                            await self.resolver.wait(referenced)
+                    # Callers may stop iterating at END, so the answer is complete before it is yielded
+                    if rsp.type == StreamingResponseType.END:
+                        complete = True
+                        if self.answer_cache is not None:
+                            self.answer_cache.put(request, events, offsets)
+                    yield rsp
+                    if complete:
+                        break
+        finally:
+            if endpoint is not None:
+                self.balancer.observe(endpoint, ttft if ttft is not None else time.monotonic() - start,
+                                      count > 0)
+            if self.recorder is not None:
+                self.recorder.record_chat(at, request, ttft, count, size, error=not complete)
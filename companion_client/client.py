@@ -1,19 +1,36 @@
-import json
-from typing import Annotated, Any, Literal, Sequence, TypeVar
-
-from httpx import AsyncClient
+import asyncio
+import hashlib
+import time
+from collections.abc import Mapping
+from concurrent.futures import Executor
+from datetime import timedelta
+from typing import Annotated, Any, AsyncIterator, Literal, Sequence, TypeVar
+from urllib.parse import urlencode
+
+from httpx import AsyncBaseTransport, AsyncClient, Request, Response, TransportError
 from pydantic import BaseModel, PositiveInt, StringConstraints, TypeAdapter, validate_call
 from pendulum import DateTime
 
+from companion_client.balancer import Endpoint, LoadBalancer
+from companion_client.batching import BatchLoader
+from companion_client.cache import CacheBackend
+from companion_client.changes import cache_tags
+from companion_client.compression import DEFAULT_ENCODINGS, CompressionStats, accept_encoding, decode_body
 from companion_client.model.course_structure import CourseDescription, CourseInstance, CourseInstanceSlot, Section
 from companion_client.model.base import CourseType, SemesterType, OptionalMultiMaterialType
 from companion_client.model.group import GroupResult
 from companion_client.model.material import Material
 from companion_client.model.course_structure import CourseTopic, SlotTypeDescription
-from companion_client.model.query import MaterialQuery, SimpleMaterialQuery, SlotQuery
+from companion_client.model.query import MaterialQuery, ParamValue, SimpleMaterialQuery, SlotQuery, canonical
 from companion_client.model.schema import MaterialTypeDescription
+from companion_client.multicourse import CourseSelection, Order, across
+from companion_client.offload import Decoder, parse_model, parse_model_list, parse_ta_list
+from companion_client.pagination import PageState, paginate
+from companion_client.refresh import RefreshScheduler
+from companion_client.timeline import SlotTimeline
+from companion_client.traffic import TrafficRecorder
 
-type PARAMS = dict[str, str | int | None]
+type PARAMS = Mapping[str, ParamValue | None]
 
 def date_to_str(date: DateTime | None) -> str | None:
     return date.to_iso8601_string() if date else None
@@ -22,44 +39,160 @@ def serialize(value: Any) -> str | None:
     return str(value) if value else None
 
 class CompanionClient:
-    def __init__(self, base_url: str, token: str = ""):
-        self.client = AsyncClient(base_url=base_url, headers={"Authorization": f"Bearer {token}"} if token else {})
+    def __init__(self, base_url: str | Sequence[str], token: str = "",
+                 compression: Sequence[str] = DEFAULT_ENCODINGS,
+                 compression_stats: CompressionStats | None = None,
+                 cache: CacheBackend | None = None, cache_ttl: float = 300,
+                 recorder: TrafficRecorder | None = None,
+                 batch_window: float | None = 0, batch_concurrency: int = 16,
+                 decode_executor: Executor | None = None, decode_threshold: int = 256 << 10,
+                 transport: AsyncBaseTransport | None = None):
+        """
+        With several base URLs (replicas of the API), requests are spread over them
+        by a LoadBalancer, which also takes failing replicas out of rotation. A GET
+        that fails with a server or transport error is retried once on another replica.
+
+        compression lists the accepted response encodings in order of preference;
+        brotli and zstd are only offered when the respective package is installed.
+
+        With a cache, GET responses are stored for cache_ttl seconds. Pass an
+        SQLiteCache to share them between the worker processes of a node. Keys include
+        a fingerprint of the token, so users only share responses they may all see. Cached
+        responses are tagged with what they contain, so that a ChangeSubscription
+        can drop exactly the affected ones.
+
+        A recorder captures every request for later replay, including cache hits.
+
+        A RefreshScheduler created for this client re-fetches frequently read
+        cache entries before they expire (see RefreshScheduler).
+
+        get_slot and get_material_for_courseslot calls made within batch_window
+        seconds (0: the same event loop tick) are deduplicated and sent as one burst
+        of at most batch_concurrency parallel requests. None disables batching.
+
+        With a decode_executor, responses of at least decode_threshold characters
+        are parsed in it instead of on the event loop (see offload.Decoder).
+
+        transport replaces the HTTP transport, e.g. with an httpx.MockTransport in tests.
+        """
+        headers = {"Accept-Encoding": accept_encoding(compression)}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.balancer = LoadBalancer(urls) if len(urls) > 1 else None
+        self.client = AsyncClient(base_url=urls[0], headers=headers, transport=transport)
+        self.compression_stats = compression_stats if compression_stats is not None else CompressionStats()
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self._principal = hashlib.sha256(token.encode()).hexdigest()[:16] if token else ""
+        self.recorder = recorder
+        self.refresher: RefreshScheduler | None = None
+        self.batch_window = batch_window
+        self._slot_loader = BatchLoader(self._load_slot, batch_window or 0, batch_concurrency)
+        self._slot_materials_loader = BatchLoader(self._load_slot_materials, batch_window or 0, batch_concurrency)
+        self.decoder = Decoder(decode_executor, decode_threshold)
 
     # Semesters
 
-    async def _get(self, path: str, params: PARAMS = {}) -> str:
+    async def _fetch(self, method: str, path: str, params: PARAMS = {}, data: PARAMS | None = None) -> str:
         if params:
             params = { k: v for k,v in params.items() if v is not None }
-        r = await self.client.get(path, params=params)
-        r.raise_for_status()
-        return r.text
+        at = self.recorder.now() if self.recorder is not None else 0.0
+        status, size = 0, 0
+        try:
+            r = await self._request(method, path, params, data)
+            status = r.status_code
+            try:
+                r.raise_for_status()
+                if r.is_stream_consumed:
+                    # In-memory responses (e.g. from a mock transport) arrive already decoded
+                    size = len(r.content)
+                    return r.text
+                raw = b"".join([chunk async for chunk in r.aiter_raw()])
+                size = len(raw)
+            finally:
+                await r.aclose()
+            return decode_body(r, raw, self.compression_stats).decode(r.charset_encoding or "utf-8")
+        finally:
+            if self.recorder is not None:
+                self.recorder.record_rest(at, method, path, params, status, size)
+
+    async def _request(self, method: str, path: str, params: PARAMS, data: PARAMS | None) -> Response:
+        if self.balancer is None:
+            return await self._send(self.client.build_request(method, path, params=params, data=data), None)
+        endpoint = self.balancer.pick()
+        request = self.client.build_request(method, endpoint.join(path), params=params, data=data)
+        if method != "GET":
+            return await self._send(request, endpoint)
+        try:
+            r = await self._send(request, endpoint)
+            if r.status_code < 500:
+                return r
+            await r.aclose()
+        except TransportError:
+            pass
+        # GETs are idempotent: retry once on another replica
+        self.balancer.retries += 1
+        endpoint = self.balancer.pick(exclude=endpoint)
+        return await self._send(self.client.build_request(method, endpoint.join(path), params=params, data=data),
+                                endpoint)
+
+    async def _send(self, request: Request, endpoint: Endpoint | None) -> Response:
+        if endpoint is None:
+            return await self.client.send(request, stream=True)
+        endpoint.inflight += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            r = await self.client.send(request, stream=True)
+            ok = r.status_code < 500
+            return r
+        finally:
+            endpoint.inflight -= 1
+            self.balancer.observe(endpoint, time.monotonic() - start, ok)
+
+    def _cache_key(self, path: str, params: PARAMS = {}) -> str:
+        query = urlencode(sorted((k, v) for k, v in params.items() if v is not None), doseq=True)
+        key = f"{self.client.base_url}{path.lstrip('/')}?{query}"
+        return f"{key}#{self._principal}" if self._principal else key
 
-    async def _get_json_list(self, path: str, params: PARAMS = {}) -> list[dict[str, Any] | list]:
-        if params:
-            params = { k: v for k,v in params.items() if v is not None }
-        r = await self.client.get(path, params=params)
-        r.raise_for_status()
-        return TypeAdapter(list).validate_json(r.text)
+    async def _get(self, path: str, params: PARAMS = {}) -> str:
+        if self.cache is None:
+            return await self._fetch("GET", path, params=params)
+        key = self._cache_key(path, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if self.refresher is not None:
+                self.refresher.record_access(key)
+            if self.recorder is not None:
+                self.recorder.record_rest(self.recorder.now(), "GET", path,
+                                          {k: v for k, v in params.items() if v is not None}, 200, 0, cached=True)
+            return cached.decode()
+        return await self._fill(key, path, params)
+
+    async def _fill(self, key: str, path: str, params: PARAMS = {}, access: bool = True) -> str:
+        text = await self._fetch("GET", path, params=params)
+        self.cache.set(key, text.encode(), self.cache_ttl, cache_tags(path, params))
+        if self.refresher is not None:
+            self.refresher.record_fetch(key, path, params, self.cache_ttl, access=access)
+        return text
 
     T = TypeVar('T', bound=BaseModel, covariant=True)
 
     async def _get_model(self, path: str, model: type[T], params: PARAMS = {}) -> T:
-        return model.model_validate_json(await self._get(path, params=params))
+        return await self.decoder(parse_model, model, await self._get(path, params=params))
 
     async def _get_model_list(self, path: str, model: type[T], params: PARAMS = {}) -> Sequence[T]:
-        r  = await self._get_json_list(path=path, params=params)
-        return [model.model_validate(x) for x in r]
+        return await self.decoder(parse_model_list, model, await self._get(path, params=params))
 
     async def _get_ta_list(self, path: str, ta: TypeAdapter[T], params: PARAMS = {}) -> Sequence[T]:
-        r  = await self._get_json_list(path=path, params=params)
-        return [ta.validate_python(s) for s in r]
+        return await self.decoder(parse_ta_list, ta, await self._get(path, params=params))
 
     async def _search_model_list(self, path: str, model: type[T], params: PARAMS = {}) -> Sequence[T]:
         if params:
             params = { k: v for k,v in params.items() if v is not None }
-        r  = await self.client.request("SEARCH", path, data=params)
-        r.raise_for_status()
-        return [model.model_validate(x) for x in r.json()]
+        r  = await self._fetch("SEARCH", path, data=params)
+        return await self.decoder(parse_model_list, model, r)
 
 
     @validate_call
@@ -106,6 +239,11 @@ class CompanionClient:
 
     @validate_call
     async def get_slot(self, slot_id: int) -> CourseInstanceSlot:
+        if self.batch_window is None:
+            return await self._load_slot(slot_id)
+        return await self._slot_loader.load(slot_id)
+
+    async def _load_slot(self, slot_id: int) -> CourseInstanceSlot:
         return await self._get_model(f"/slots/{slot_id}", CourseInstanceSlot)
 
     @validate_call
@@ -115,7 +253,7 @@ class CompanionClient:
     async def _get_slots(self, suffix: str, q: SlotQuery) -> Sequence[CourseInstanceSlot]:      
         return await self._get_model_list(f"/slots/{q.course}/{q.semester}{suffix}", 
                                           CourseInstanceSlot,
-                                           params=q.model_dump())
+                                           params=q.params)
 
     @validate_call
     async def get_recent_slots(self, q: SlotQuery) -> Sequence[CourseInstanceSlot]:
@@ -125,13 +263,19 @@ class CompanionClient:
     async def get_upcoming_slots(self, q: SlotQuery) -> Sequence[CourseInstanceSlot]:
         return await self._get_slots("/upcoming", q)
 
+    async def get_slot_timeline(self, course: CourseType, semester: SemesterType) -> SlotTimeline:
+        """ All slots of a course instance for answering recent/upcoming queries locally """
+        instance, slots = await asyncio.gather(self.get_course_instance(course, semester),
+                                               self.get_slots(SlotQuery(course=course, semester=semester)))
+        return SlotTimeline(slots, duration=timedelta(minutes=instance.default_duration))
+
     @validate_call
     async def get_topics(self, course: str) -> Sequence[CourseTopic]:
         return await self._get_model_list(f"/topics/{course}", CourseTopic)
 
     @validate_call
     async def get_materials(self, q: MaterialQuery):
-        return await self._get_model_list("/materials", Material, params=q.model_dump())
+        return await self._get_model_list("/materials", Material, params=q.params)
 
     @validate_call
     async def get_material(self, qid: Annotated[str, StringConstraints(pattern="ci[s]?:[0-9]+")] | None = None,
@@ -146,31 +290,76 @@ class CompanionClient:
     async def get_material_for_courseslot(self, slot: CourseInstanceSlot | int,
                                              material_type: OptionalMultiMaterialType = None) -> Sequence[Material]:
         slot = slot.id if isinstance(slot, CourseInstanceSlot) else slot
+        key = (slot, canonical(material_type))
+        if self.batch_window is None:
+            return await self._load_slot_materials(key)
+        return await self._slot_materials_loader.load(key)
+
+    async def _load_slot_materials(self, key: tuple[int, ParamValue | None]) -> Sequence[Material]:
+        slot, material_type = key
         if material_type is None:
             return await self._get_model_list(path=f"/materials/{slot}", model=Material)
+        if isinstance(material_type, tuple):
+            material_type = ",".join(map(str, material_type))
         return await self._get_model_list(path=f"/materials/{slot}/{material_type}", model=Material)
 
     @validate_call
     async def get_grouped_materials_by_topic(self, q: SimpleMaterialQuery) -> Sequence[GroupResult]:
         if q.course is None or q.semester is None:
             raise ValueError("course and semester must be provided")
-        return await self._get_model_list(f"/grouped/by-topic/{q.course}/{q.semester}", GroupResult, params=q.model_dump())
+        return await self._get_model_list(f"/grouped/by-topic/{q.course}/{q.semester}", GroupResult, params=q.params)
 
     @validate_call
     async def get_grouped_materials_by_section(self, q: SimpleMaterialQuery) -> Sequence[GroupResult]:
         if q.course is None or q.semester is None:
             raise ValueError("course and semester must be provided")
-        return await self._get_model_list(f"/grouped/by-section/{q.course}/{q.semester}", GroupResult, params=q.model_dump())
+        return await self._get_model_list(f"/grouped/by-section/{q.course}/{q.semester}", GroupResult, params=q.params)
 
     @validate_call
     async def get_grouped_materials_by_slot(self, q: SimpleMaterialQuery) -> Sequence[GroupResult]:
         if q.slot_type is None or q.course is None or q.semester is None:
             raise ValueError("slot_type, course, and semester must be provided")
-        return await self._get_model_list(f"/grouped/by-slot/{q.slot_type}/{q.course}/{q.semester}", GroupResult, params=q.model_dump())
+        return await self._get_model_list(f"/grouped/by-slot/{q.slot_type}/{q.course}/{q.semester}", GroupResult, params=q.params)
 
 
     @validate_call
     async def get_sections(self, course: CourseType, semester: SemesterType) -> Sequence[Section]:
         return await self._get_model_list(f"/sections/{course}/{semester}", Section)
-        
-    
\ No newline at end of file
+
+
+    # Queries across courses, see companion_client.multicourse.across
+
+    def get_materials_across(self, selections: Sequence[CourseSelection], q: MaterialQuery = MaterialQuery(),
+                             order: Order = "start_date", limit: int | None = None) -> AsyncIterator[Material]:
+        return across(self.get_materials, selections, q, order, limit)
+
+    def get_slots_across(self, selections: Sequence[CourseSelection], q: SlotQuery = SlotQuery(),
+                         order: Order = "start_date", limit: int | None = None) -> AsyncIterator[CourseInstanceSlot]:
+        return across(self.get_slots, selections, q, order, limit)
+
+    def get_upcoming_slots_across(self, selections: Sequence[CourseSelection], q: SlotQuery = SlotQuery(),
+                                  order: Order = "start_date",
+                                  limit: int | None = None) -> AsyncIterator[CourseInstanceSlot]:
+        return across(self.get_upcoming_slots, selections, q, order, limit)
+
+    # Paginated iteration, see companion_client.pagination.paginate
+
+    def paginate_slots(self, q: SlotQuery, page_size: int = 500, read_ahead: int = 1,
+                       state: PageState | None = None) -> AsyncIterator[CourseInstanceSlot]:
+        return paginate(self.get_slots, q, page_size, read_ahead, state)
+
+    def paginate_materials(self, q: MaterialQuery, page_size: int = 500, read_ahead: int = 1,
+                           state: PageState | None = None) -> AsyncIterator[Material]:
+        return paginate(self.get_materials, q, page_size, read_ahead, state)
+
+    def paginate_grouped_materials_by_topic(self, q: SimpleMaterialQuery, page_size: int = 100, read_ahead: int = 1,
+                                            state: PageState | None = None) -> AsyncIterator[GroupResult]:
+        return paginate(self.get_grouped_materials_by_topic, q, page_size, read_ahead, state)
+
+    def paginate_grouped_materials_by_section(self, q: SimpleMaterialQuery, page_size: int = 100, read_ahead: int = 1,
+                                              state: PageState | None = None) -> AsyncIterator[GroupResult]:
+        return paginate(self.get_grouped_materials_by_section, q, page_size, read_ahead, state)
+
+    def paginate_grouped_materials_by_slot(self, q: SimpleMaterialQuery, page_size: int = 100, read_ahead: int = 1,
+                                           state: PageState | None = None) -> AsyncIterator[GroupResult]:
+        return paginate(self.get_grouped_materials_by_slot, q, page_size, read_ahead, state)
@@ -0,0 +1,143 @@
+import time
+import zlib
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+from httpx_ws import AsyncWebSocketSession
+from wsproto import ConnectionType
+from wsproto.connection import Connection
+from wsproto.extensions import PerMessageDeflate
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DEFAULT_ENCODINGS = ("zstd", "br", "gzip")
+WS_DEFLATE_OFFER = f"{PerMessageDeflate.name}; {PerMessageDeflate().offer()}"
+
+
+def _gunzip(data: bytes) -> bytes:
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def _inflate(data: bytes) -> bytes:
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+def _zstd(data: bytes) -> bytes:
+    chunks = []
+    while data:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()  # type: ignore[union-attr]
+        chunks.append(decompressor.decompress(data))
+        data = decompressor.unused_data if decompressor.eof else b""
+    return b"".join(chunks)
+
+
+DECODERS: dict[str, Callable[[bytes], bytes]] = {
+    "identity": lambda data: data,
+    "gzip": _gunzip,
+    "x-gzip": _gunzip,
+    "deflate": _inflate,
+}
+if brotli is not None:
+    DECODERS["br"] = brotli.decompress
+if zstandard is not None:
+    DECODERS["zstd"] = _zstd
+
+
+def accept_encoding(encodings: Sequence[str]) -> str:
+    """ Accept-Encoding header for the supported subset of encodings, in order of preference """
+    supported = [e for e in encodings if e in DECODERS and e != "identity"]
+    if not supported:
+        return "identity"
+    return ", ".join(e if i == 0 else f"{e};q={1 - i / 10:.1f}" for i, e in enumerate(supported))
+
+
+@dataclass
+class EncodingStats:
+    responses: int = 0
+    encoded_bytes: int = 0
+    decoded_bytes: int = 0
+    decode_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.decoded_bytes / self.encoded_bytes if self.encoded_bytes else 1.0
+
+
+@dataclass
+class CompressionStats:
+    """ Transferred vs. decoded bytes and decode time, per content encoding """
+
+    http: dict[str, EncodingStats] = field(default_factory=dict)
+    websocket: EncodingStats = field(default_factory=EncodingStats)
+
+    def record(self, encoding: str, encoded: int, decoded: int, seconds: float) -> None:
+        stats = self.http.setdefault(encoding, EncodingStats())
+        stats.responses += 1
+        stats.encoded_bytes += encoded
+        stats.decoded_bytes += decoded
+        stats.decode_seconds += seconds
+
+
+def decode_body(response: httpx.Response, raw: bytes, stats: CompressionStats | None = None) -> bytes:
+    """ Decodes a body read with aiter_raw() according to its Content-Encoding """
+    encodings = [e.strip().lower() for e in response.headers.get("content-encoding", "identity").split(",") if e.strip()]
+    start = time.perf_counter()
+    data = raw
+    for encoding in reversed(encodings):
+        decoder = DECODERS.get(encoding)
+        if decoder is None:
+            raise httpx.DecodingError(f"Unsupported content encoding {encoding!r}", request=response.request)
+        try:
+            data = decoder(data)
+        except Exception as e:
+            raise httpx.DecodingError(f"Failed to decode {encoding!r} response: {e}", request=response.request) from e
+    if stats is not None:
+        stats.record(",".join(encodings) or "identity", len(raw), len(data), time.perf_counter() - start)
+    return data
+
+
+class _CountingStream:
+    """ Counts bytes read from the network below the WebSocket framing """
+
+    def __init__(self, stream: Any, stats: EncodingStats):
+        self._stream = stream
+        self._stats = stats
+
+    async def read(self, max_bytes: int, timeout: float | None = None) -> bytes:
+        data = await self._stream.read(max_bytes, timeout)
+        self._stats.encoded_bytes += len(data)
+        return data
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+def deflate_session(stats: CompressionStats | None = None) -> type[AsyncWebSocketSession]:
+    """ Session class enabling permessage-deflate when the server accepted the offer """
+
+    class DeflateWebSocketSession(AsyncWebSocketSession):
+        def __init__(self, stream: Any, **kwargs: Any):
+            if stats is not None:
+                stream = _CountingStream(stream, stats.websocket)
+            super().__init__(stream, **kwargs)
+            accepted = self.response.headers.get("sec-websocket-extensions", "") if self.response else ""
+            for offer in accepted.split(","):
+                if offer.split(";", 1)[0].strip() == PerMessageDeflate.name:
+                    extension = PerMessageDeflate()
+                    extension.finalize(offer.strip())
+                    self.connection = Connection(ConnectionType.CLIENT, extensions=[extension])
+
+    return DeflateWebSocketSession
@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import heapq
+import json
+import os
+from collections import Counter
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Literal
+
+import httpx
+import pendulum
+from pendulum import DateTime
+
+from companion_client.model.material import Material
+
+if TYPE_CHECKING:
+    from companion_client.client import CompanionClient
+
+
+WRITE_SIZE = 1 << 20
+""" Received bytes are written and hashed in a worker thread once this many are buffered """
+
+
+def download_url(m: Material) -> str | None:
+    """ The file to index: the index-only copy if there is one, else the direct link """
+    return m.index_only_full_url or m.full_direct_url or m.full_url
+
+
+def next_index_time(m: Material, unit: timedelta = timedelta(days=1)) -> DateTime | None:
+    """
+    When a material is due for (re)indexing: immediately if it never was, after
+    reindex_interval units otherwise; None if it is not indexed or never reindexed.
+    """
+    if m.no_indexing or download_url(m) is None:
+        return None
+    if m.last_indexed is None:
+        return pendulum.from_timestamp(0)
+    if m.reindex_interval is None:
+        return None
+    return m.last_indexed + unit * m.reindex_interval
+
+
+def due(materials: Iterable[Material], now: DateTime | None = None,
+        unit: timedelta = timedelta(days=1)) -> list[Material]:
+    """ The materials due at now, most overdue first """
+    now = now or pendulum.now()
+    heap = [(t, i, m) for i, m in enumerate(materials) if (t := next_index_time(m, unit)) is not None]
+    heapq.heapify(heap)
+    result = []
+    while heap and heap[0][0] <= now:
+        result.append(heapq.heappop(heap)[2])
+    return result
+
+
+@dataclass
+class Validators:
+    etag: str | None = None
+    last_modified: str | None = None
+    digest: str | None = None
+    size: int = 0
+
+    @classmethod
+    def of(cls, response: httpx.Response) -> "Validators":
+        return cls(etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"))
+
+
+class ContentStore:
+    """
+    Files on disk by the sha256 of their content (objects/ab/abcd...), with the
+    validators of the URL they were last downloaded from (meta/) and partial
+    downloads that can be resumed (partial/).
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        for d in ("objects", "meta", "partial"):
+            (self.root / d).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def _read(self, path: Path) -> Validators | None:
+        try:
+            return Validators(**json.loads(path.read_text()))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+    def _write(self, path: Path, validators: Validators) -> None:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(validators)))
+        os.replace(tmp, path)
+
+    def validators(self, url: str) -> Validators | None:
+        """ Validators of the stored copy of url, if that copy still exists """
+        v = self._read(self.root / "meta" / f"{self._name(url)}.json")
+        return v if v is not None and v.digest is not None and self.path(v.digest).exists() else None
+
+    def partial(self, url: str) -> tuple[Path, Validators | None]:
+        name = self._name(url)
+        return self.root / "partial" / name, self._read(self.root / "partial" / f"{name}.json")
+
+    def start_partial(self, url: str, validators: Validators) -> Path:
+        path, _ = self.partial(url)
+        self._write(path.with_name(f"{path.name}.json"), validators)
+        path.write_bytes(b"")
+        return path
+
+    def discard_partial(self, url: str) -> None:
+        path, _ = self.partial(url)
+        path.unlink(missing_ok=True)
+        path.with_name(f"{path.name}.json").unlink(missing_ok=True)
+
+    def commit(self, url: str, partial: Path, validators: Validators) -> Path:
+        """ Moves a finished download into place and records its validators """
+        target = self.path(validators.digest)
+        target.parent.mkdir(exist_ok=True)
+        os.replace(partial, target)
+        partial.with_name(f"{partial.name}.json").unlink(missing_ok=True)
+        self._write(self.root / "meta" / f"{self._name(url)}.json", validators)
+        return target
+
+
+def _hash_file(path: Path, hasher: Any) -> None:
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            hasher.update(chunk)
+
+
+def _write(f: BinaryIO, hasher: Any, data: bytes) -> None:
+    f.write(data)
+    hasher.update(data)
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    status: Literal["downloaded", "resumed", "unchanged", "failed"]
+    path: Path | None = None
+    digest: str | None = None
+    bytes: int = 0
+    """ Bytes transferred """
+    error: str | None = None
+
+
+class Downloader:
+    """
+    Downloads material files through the client's connection pool into a
+    ContentStore. Unchanged files are skipped with If-None-Match/If-Modified-Since,
+    interrupted downloads resume with a Range request. At most per_host downloads
+    run against one host and at most concurrency in total; downloads of the same
+    URL run one after the other.
+    """
+
+    def __init__(self, client: "CompanionClient", root: str | Path, per_host: int = 4, concurrency: int = 32):
+        self.client = client
+        self.store = ContentStore(root)
+        self.per_host = per_host
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._urls: dict[str, asyncio.Lock] = {}
+        self._url_users: Counter[str] = Counter()
+
+    def _request(self, url: str, headers: dict[str, str]) -> httpx.Request:
+        request = self.client.client.build_request("GET", url, headers=headers)
+        if request.url.host != self.client.client.base_url.host:
+            # The API token is not meant for file hosts
+            request.headers.pop("Authorization", None)
+        return request
+
+    async def download(self, url: str) -> DownloadResult:
+        host = httpx.URL(url).host
+        semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        # Downloads of one URL share its partial file
+        lock = self._urls.setdefault(url, asyncio.Lock())
+        self._url_users[url] += 1
+        try:
+            async with lock, self._semaphore, semaphore:
+                try:
+                    return await self._download(url)
+                except (httpx.HTTPError, OSError) as e:
+                    return DownloadResult(url, "failed", error=str(e))
+        finally:
+            self._url_users[url] -= 1
+            if not self._url_users[url]:
+                del self._url_users[url], self._urls[url]
+
+    async def _download(self, url: str) -> DownloadResult:
+        # Offsets of partial downloads refer to the bytes on the wire
+        headers = {"Accept-Encoding": "identity"}
+        stored = self.store.validators(url)
+        if stored is not None:
+            if stored.etag:
+                headers["If-None-Match"] = stored.etag
+            if stored.last_modified:
+                headers["If-Modified-Since"] = stored.last_modified
+        partial, started = self.store.partial(url)
+        offset = partial.stat().st_size if started is not None and partial.exists() else 0
+        if offset and (started.etag or started.last_modified):
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = started.etag or started.last_modified
+
+        r = await self.client.client.send(self._request(url, headers), stream=True, follow_redirects=True)
+        restart = False
+        try:
+            if r.status_code == 304 and stored is not None:
+                return DownloadResult(url, "unchanged", self.store.path(stored.digest), stored.digest)
+            if r.status_code == 416 and offset:
+                # The partial file is either complete but was never committed, or no prefix of the file
+                total = r.headers.get("content-range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == offset:
+                    hasher = hashlib.sha256()
+                    await asyncio.to_thread(_hash_file, partial, hasher)
+                    started.digest, started.size = hasher.hexdigest(), offset
+                    return DownloadResult(url, "resumed", self.store.commit(url, partial, started), started.digest)
+                self.store.discard_partial(url)
+                restart = True
+            else:
+                r.raise_for_status()
+                hasher = hashlib.sha256()
+                if r.status_code == 206 and started is not None:
+                    await asyncio.to_thread(_hash_file, partial, hasher)
+                    validators = started
+                else:
+                    validators = Validators.of(r)
+                    partial = self.store.start_partial(url, validators)
+                transferred = await self._receive(r, partial, hasher)
+        finally:
+            await r.aclose()
+        if restart:
+            return await self._download(url)
+        validators.digest = hasher.hexdigest()
+        validators.size = partial.stat().st_size
+        path = self.store.commit(url, partial, validators)
+        return DownloadResult(url, "resumed" if r.status_code == 206 else "downloaded", path,
+                              validators.digest, transferred)
+
+    @staticmethod
+    async def _receive(r: httpx.Response, partial: Path, hasher: Any) -> int:
+        """ Appends the body of r to partial off the event loop, returns the bytes received """
+        transferred = 0
+        buffer = bytearray()
+        f = await asyncio.to_thread(open, partial, "ab")
+        try:
+            async for chunk in r.aiter_raw():
+                buffer += chunk
+                transferred += len(chunk)
+                if len(buffer) >= WRITE_SIZE:
+                    await asyncio.to_thread(_write, f, hasher, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_write, f, hasher, bytes(buffer))
+        finally:
+            await asyncio.to_thread(f.close)
+        return transferred
+
+    async def download_due(self, materials: Iterable[Material], now: DateTime | None = None,
+                           unit: timedelta = timedelta(days=1)) -> AsyncIterator[tuple[Material, DownloadResult]]:
+        """ Downloads the files of the due materials, yielding them as they complete """
+        by_url: dict[str, list[Material]] = {}
+        for m in due(materials, now, unit):
+            by_url.setdefault(download_url(m), []).append(m)
+
+        async def run(url: str, shared: list[Material]) -> tuple[list[Material], DownloadResult]:
+            return shared, await self.download(url)
+
+        tasks = [asyncio.create_task(run(url, shared)) for url, shared in by_url.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                shared, result = await next_done
+                for m in shared:
+                    yield m, result
+        finally:
+            for t in tasks:
+                t.cancel()
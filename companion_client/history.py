@@ -0,0 +1,294 @@
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Hashable, Iterator
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from companion_client.model.chat import ChatStreamingRequest
+from companion_client.model.chat_messages import GPTAIMessage, GPTHumanMessage, GPTMessage, GPTSystemMessage
+from companion_client.model.course_structure import CourseDescription
+from companion_client.model.similarity_search import DocumentChunk
+
+type DocumentKey = tuple[str, int | None, int | None]
+type DocumentRef = DocumentKey | DocumentChunk
+
+OVERHEAD = 256
+""" Approximate bytes of a message or chunk beyond its text """
+REF_SIZE = 64
+
+
+def _text_size(*texts: str | None) -> int:
+    return sum(len(t) for t in texts if t)
+
+
+def chunk_size(chunk: DocumentChunk) -> int:
+    """ Approximate bytes held by chunk """
+    size = OVERHEAD + _text_size(chunk.id, chunk.qid, chunk.title, chunk.content, chunk.slot_title, chunk.url)
+    if chunk.material is not None:
+        size += len(chunk.material.model_dump_json())
+    return size
+
+
+class CompactMessage(NamedTuple):
+    """ A history entry; documents are referenced through the store's shared document table """
+
+    type: str
+    timestamp: datetime
+    content: str
+    req_id: str | None
+    course: str | None
+    semester: str | None
+    additional_kwargs: dict | None = None
+    material_ids: tuple[str, ...] = ()
+    topic_suggestions_id: tuple[str, ...] = ()
+    question_suggestions: tuple[str, ...] = ()
+    documents: tuple[DocumentRef, ...] = ()
+    is_info_prompt: bool = False
+
+
+class DocumentTable:
+    """
+    Reference-counted chunks shared by all threads, keyed by qid and position.
+    size is the approximate bytes of the chunks held.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._chunks: dict[DocumentKey, list] = {}
+
+    @staticmethod
+    def key(chunk: DocumentChunk) -> DocumentKey | None:
+        return None if chunk.qid is None else (chunk.qid, chunk.pos, chunk.pos_end)
+
+    def acquire(self, chunk: DocumentChunk) -> DocumentRef:
+        key = self.key(chunk)
+        if key is None:
+            return chunk
+        entry = self._chunks.get(key)
+        if entry is None:
+            self._chunks[key] = [chunk, 1]
+            self.size += chunk_size(chunk)
+        else:
+            entry[1] += 1
+        return key
+
+    def release(self, ref: DocumentRef) -> None:
+        if isinstance(ref, DocumentChunk):
+            return
+        entry = self._chunks[ref]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._chunks[ref]
+            self.size -= chunk_size(entry[0])
+
+    def resolve(self, ref: DocumentRef) -> DocumentChunk:
+        return ref if isinstance(ref, DocumentChunk) else self._chunks[ref][0]
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+
+class TimerWheel[K: Hashable]:
+    """
+    Hashed timer wheel. Scheduling and cancelling are O(1); advancing visits only
+    the buckets whose tick has passed.
+    """
+
+    def __init__(self, resolution: float, horizon: float, now: float):
+        self.resolution = resolution
+        self._buckets: list[set[K]] = [set() for _ in range(int(horizon / resolution) + 2)]
+        self._scheduled: dict[K, int] = {}
+        self._tick = self._to_tick(now)
+
+    def _to_tick(self, t: float) -> int:
+        return int(t // self.resolution)
+
+    def schedule(self, key: K, deadline: float) -> None:
+        tick = max(self._to_tick(deadline), self._tick)
+        old = self._scheduled.get(key)
+        if old == tick:
+            return
+        if old is not None:
+            self._buckets[old % len(self._buckets)].discard(key)
+        self._buckets[tick % len(self._buckets)].add(key)
+        self._scheduled[key] = tick
+
+    def cancel(self, key: K) -> None:
+        tick = self._scheduled.pop(key, None)
+        if tick is not None:
+            self._buckets[tick % len(self._buckets)].discard(key)
+
+    def advance(self, now: float) -> Iterator[K]:
+        """ Yields keys of passed ticks. Keys scheduled beyond the horizon may come early, callers re-check """
+        target = self._to_tick(now)
+        steps = min(target - self._tick, len(self._buckets))
+        for tick in range(self._tick, self._tick + steps):
+            bucket = self._buckets[tick % len(self._buckets)]
+            self._buckets[tick % len(self._buckets)] = set()
+            for key in bucket:
+                del self._scheduled[key]
+                yield key
+        self._tick = max(self._tick, target)
+
+
+class _Thread:
+    __slots__ = ("messages", "ttl", "expires", "size")
+
+    def __init__(self, max_history: int, ttl: float):
+        self.messages: deque[CompactMessage] = deque(maxlen=max_history)
+        self.ttl = ttl
+        self.expires = 0.0
+        self.size = 0
+
+
+class ChatHistoryStore:
+    """
+    Bounded per-thread chat history.
+
+    Each thread keeps at most max_history messages in a ring buffer and expires ttl
+    after its last use. At most max_threads are held, taking up about max_bytes
+    together with the shared document table; beyond either limit the least recently
+    used threads are dropped. size is the approximate bytes held.
+    """
+
+    def __init__(self, max_history: int = 4, ttl: timedelta = timedelta(hours=1),
+                 max_threads: int = 100_000, max_bytes: int = 256 << 20, resolution: timedelta = timedelta(seconds=10),
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_history = max_history
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.documents = DocumentTable()
+        self._size = 0
+        self._clock = clock
+        self._threads: OrderedDict[str, _Thread] = OrderedDict()
+        self._wheel: TimerWheel[str] = TimerWheel(resolution.total_seconds(), ttl.total_seconds(), clock())
+
+    @classmethod
+    def for_course(cls, course: CourseDescription, **kwargs) -> "ChatHistoryStore":
+        return cls(max_history=course.max_history, ttl=timedelta(minutes=course.history_ttl_minutes), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    @property
+    def size(self) -> int:
+        return self._size + self.documents.size
+
+    def __contains__(self, thread_id: str) -> bool:
+        return thread_id in self._threads
+
+    def append(self, thread_id: str, message: GPTMessage | GPTSystemMessage,
+               max_history: int | None = None, ttl: timedelta | None = None) -> None:
+        now = self._clock()
+        self.prune(now)
+
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            thread = _Thread(self.max_history if max_history is None else max_history,
+                             (self.ttl if ttl is None else ttl).total_seconds())
+            self._threads[thread_id] = thread
+            while len(self._threads) > self.max_threads:
+                self._drop(next(iter(self._threads)))
+        elif max_history is not None and max_history != thread.messages.maxlen:
+            self._resize(thread, max_history)
+        if ttl is not None:
+            thread.ttl = ttl.total_seconds()
+
+        if thread.messages.maxlen:  # max_history=0 keeps no history
+            if len(thread.messages) == thread.messages.maxlen:
+                self._release(thread, thread.messages[0])
+            compact = self._compact(message)
+            thread.messages.append(compact)
+            self._add_size(thread, self._message_size(compact))
+        self._touch(thread_id, thread, now)
+        # The thread just used is kept even if it alone exceeds the budget
+        while self.size > self.max_bytes and len(self._threads) > 1:
+            self._drop(next(iter(self._threads)))
+
+    def append_request(self, request: ChatStreamingRequest, message: GPTMessage) -> None:
+        """ Uses the history limits of the request """
+        self.append(request.thread_id, message, max_history=request.max_history, ttl=request.time_window)
+
+    def get(self, thread_id: str) -> list[GPTMessage | GPTSystemMessage]:
+        now = self._clock()
+        self.prune(now)
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            return []
+        self._touch(thread_id, thread, now)
+        return [self._expand(m) for m in thread.messages]
+
+    def discard(self, thread_id: str) -> None:
+        if thread_id in self._threads:
+            self._drop(thread_id)
+
+    def prune(self, now: float | None = None) -> int:
+        """ Drops expired threads, returns their number """
+        now = self._clock() if now is None else now
+        dropped = 0
+        for thread_id in list(self._wheel.advance(now)):
+            thread = self._threads[thread_id]
+            if thread.expires <= now:
+                self._drop(thread_id)
+                dropped += 1
+            else:
+                self._wheel.schedule(thread_id, thread.expires)
+        return dropped
+
+    def _touch(self, thread_id: str, thread: _Thread, now: float) -> None:
+        thread.expires = now + thread.ttl
+        self._threads.move_to_end(thread_id)
+        self._wheel.schedule(thread_id, thread.expires)
+
+    def _resize(self, thread: _Thread, max_history: int) -> None:
+        while len(thread.messages) > max_history:
+            self._release(thread, thread.messages.popleft())
+        thread.messages = deque(thread.messages, maxlen=max_history)
+
+    def _drop(self, thread_id: str) -> None:
+        thread = self._threads.pop(thread_id)
+        self._wheel.cancel(thread_id)
+        for m in thread.messages:
+            self._release(thread, m)
+
+    def _add_size(self, thread: _Thread, size: int) -> None:
+        thread.size += size
+        self._size += size
+
+    def _release(self, thread: _Thread, message: CompactMessage) -> None:
+        self._add_size(thread, -self._message_size(message))
+        for ref in message.documents:
+            self.documents.release(ref)
+
+    @staticmethod
+    def _message_size(m: CompactMessage) -> int:
+        """ Approximate bytes held by m; keyed documents are counted in the document table """
+        return (OVERHEAD + _text_size(m.content, m.req_id, *m.material_ids, *m.topic_suggestions_id,
+                                      *m.question_suggestions)
+                + (len(repr(m.additional_kwargs)) if m.additional_kwargs else 0)
+                + sum(chunk_size(d) if isinstance(d, DocumentChunk) else REF_SIZE for d in m.documents))
+
+    def _compact(self, m: GPTMessage | GPTSystemMessage) -> CompactMessage:
+        if isinstance(m, GPTAIMessage):
+            return CompactMessage(m.type, m.timestamp, m.content, m.req_id, m.course, m.semester,
+                                  m.additional_kwargs or None,
+                                  tuple(m.material_ids), tuple(m.topic_suggestions_id), tuple(m.question_suggestions),
+                                  tuple(self.documents.acquire(d) for d in m.documents), m.is_info_prompt)
+        return CompactMessage(m.type, m.timestamp, m.content, m.req_id, m.course, m.semester,
+                              m.additional_kwargs or None)
+
+    def _expand(self, m: CompactMessage) -> GPTMessage | GPTSystemMessage:
+        common = dict(timestamp=m.timestamp, content=m.content, req_id=m.req_id, course=m.course,
+                      semester=m.semester, additional_kwargs=dict(m.additional_kwargs or {}))
+        if m.type == "ai":
+            return GPTAIMessage.model_construct(**common,
+                                                material_ids=list(m.material_ids),
+                                                topic_suggestions_id=list(m.topic_suggestions_id),
+                                                question_suggestions=list(m.question_suggestions),
+                                                documents=[self.documents.resolve(d) for d in m.documents],
+                                                is_info_prompt=m.is_info_prompt)
+        if m.type == "system":
+            return GPTSystemMessage.model_construct(**common)
+        return GPTHumanMessage.model_construct(**common)
+
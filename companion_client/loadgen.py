@@ -0,0 +1,44 @@
+"""
+Replays a traffic recording against a Companion API and reports throughput,
+latency percentiles, error rate and time to first token.
+
+    python -m companion_client.loadgen recording.jsonl --base-url http://localhost:8000/v1 --speedup 10
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from companion_client.traffic import Report, load, replay
+
+
+def format_report(report: Report) -> str:
+    def ms(v: float | None) -> str:
+        return "-" if v is None else f"{v * 1000:.1f}ms"
+
+    lines = [f"requests   {report.requests} in {report.wall_seconds:.1f}s ({report.throughput:.1f}/s)",
+             f"errors     {report.errors} ({report.error_rate:.2%})"]
+    for kind, stats in report.latency.items():
+        lines.append(f"{kind:<10} " + " ".join(f"{k}={ms(v)}" for k, v in stats.items()))
+    lines.append("ttft       " + " ".join(f"{k}={ms(v)}" for k, v in report.ttft.items()))
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="companion_client.loadgen", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", help="JSON lines written by a TrafficRecorder")
+    parser.add_argument("--base-url", required=True, help="API base URL, e.g. http://localhost:8000/v1")
+    parser.add_argument("--speedup", type=float, default=1.0, help="compress recorded time by this factor")
+    parser.add_argument("--concurrency", type=int, default=256, help="maximum outstanding calls")
+    parser.add_argument("--token", default="", help="bearer token")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(replay(load(args.recording), args.base_url.rstrip("/"), speedup=args.speedup,
+                                concurrency=args.concurrency, token=args.token))
+    print(json.dumps(report.to_dict(), indent=2) if args.json else format_report(report))
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
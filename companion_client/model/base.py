@@ -72,6 +72,9 @@ def canonicalize_semester(semester: str | None) -> str | None:
 
     return semester
 
+def canonical_semester_or_none(v: str | None) -> str | None:
+    return canonicalize_semester(empty_to_none(v))
+
 MarkdownStr = str
 
 SafeStr = Annotated[str,
@@ -89,7 +92,7 @@ SemesterType = Annotated[str,
                          description="Semester in the format of 'YYYY-SS' or 'YYYY-WS', where 'SS' stands for summer semester and 'WS' for winter semester.",
                          examples=["2023-WS", "2024-WS", "2024-SS"])]
 OptionalSemesterType = Annotated[SemesterType | None,
-                         BeforeValidator(empty_to_none),
+                         BeforeValidator(canonical_semester_or_none),
                          Field(title="Semester", examples=["2023-WS", "2023-SS"])]
 
 
@@ -1,8 +1,11 @@
 from __future__ import annotations
+import json
+import weakref
 from collections.abc import Sequence
 from datetime import timedelta
 from enum import StrEnum
-from pydantic import BaseModel
+from typing import Any
+from pydantic import BaseModel, ValidationError
 from companion_client.model.chat_messages import GPTBaseMessage
 from companion_client.model.course_structure import CourseDescription, CourseTopic
 from companion_client.model.group import MaterialGroup
@@ -28,6 +31,25 @@ class SessionAware(ThreadAware, frozen=True):
     req_id_generated: bool = False
 
 
+_course_json: dict[int, tuple[CourseDescription, str]] = {}
+
+
+def course_json(course: CourseDescription) -> str:
+    """
+    The JSON of a course description, serialized once per instance. The cache keeps a
+    deep copy of the course and serializes it again once the course was changed.
+    """
+    key = id(course)
+    cached = _course_json.get(key)
+    if cached is not None and cached[0] == course:
+        return cached[1]
+    if cached is None:
+        weakref.finalize(course, _course_json.pop, key, None)
+    text = course.model_dump_json()
+    _course_json[key] = (course.model_copy(deep=True), text)
+    return text
+
+
 class ChatStreamingRequest(CourseAware, SessionAware, frozen=True):
     course_desc: CourseDescription
     message: str
@@ -42,6 +64,16 @@ class ChatStreamingRequest(CourseAware, SessionAware, frozen=True):
     max_sources_display: int = 4
     max_slots: int = 4
 
+    def to_json(self) -> str:
+        """
+        Same document as model_dump_json(), but the course descriptions are spliced in
+        from their cached serialization, so only the message specific fields are encoded.
+        """
+        fields = self.model_dump_json(exclude={"course_description", "course_desc"})
+        desc = course_json(self.course_desc)
+        description = desc if self.course_description is self.course_desc else course_json(self.course_description)
+        return f'{{"course_description":{description},"course_desc":{desc},{fields[1:]}'
+
 class StreamingResponseType(StrEnum):
     SOURCES = "sources"
     MATERIALS = "materials"
@@ -63,6 +95,12 @@ class StreamingResponseType(StrEnum):
                 return ChatStreamingTopicSuggestionResponse
             case self.SOURCES:
                 return ChatStreamingSourcesResponse
+            case self.MATERIALS:
+                return ChatStreamingMaterialResponse
+            case self.RESPONSE:
+                return ChatStreamingFullResponse
+            case self.END:
+                return ChatStreamingResponseEnd
             case _:
                 return ChatStreamingResponse
 
@@ -72,6 +110,22 @@ class ChatStreamingResponse(BaseModel, frozen=True):
 
     type: StreamingResponseType
 
+    @classmethod
+    def parse(cls, message: str | bytes) -> ChatStreamingResponse:
+        """
+        Validates a message as the response class of its type. Events that do not
+        validate (e.g. materials referenced by qid only) become ChatStreamingRawResponse.
+        """
+        data = json.loads(message)
+        try:
+            return StreamingResponseType(data["type"]).response_class().model_validate(data)
+        except ValidationError:
+            return ChatStreamingRawResponse.model_validate(data)
+
+class ChatStreamingRawResponse(ChatStreamingResponse, frozen=True, extra="allow"):
+    """ An event as sent, for events that do not validate as the response class of their type """
+    value: Any = None
+
 class ChatStreamingResponseEnd(ChatStreamingResponse, frozen=True):
     type: StreamingResponseType = StreamingResponseType.END
     full_answer: bool = True
@@ -1,17 +1,85 @@
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
+from enum import Enum
+from functools import cached_property
+from typing import Any, Self
+from urllib.parse import urlencode
 
+from pendulum import DateTime
 from pydantic import BaseModel, NonNegativeInt, PositiveInt
 from pydantic_extra_types.pendulum_dt import DateTime as PendulumDateTime
 from companion_client.model.base import SafeStr, OptionalCourseType, OptionalSemesterType, OptionalGroupType, OptionalSlotType, OptionalMultiGroupType, OptionalMultiSlotType, OptionalMultiMaterialType
 from companion_client.model.schema import MaterialTypeDescription
 
+type ParamValue = str | int | float | tuple[str | int | float, ...]
+
+
+def canonical(value: Any) -> ParamValue | None:
+    """
+    Normalizes a query value to its wire form. Sequences are deduplicated and sorted,
+    so that "a", ["a"] and ("a", "a") as well as ["b", "c"] and ["c", "b"] are equal.
+    """
+    match value:
+        case None:
+            return None
+        case bool():
+            return "true" if value else "false"
+        case Enum():
+            return value.value
+        case str() | int() | float():
+            return value
+        case DateTime():
+            return value.to_iso8601_string()
+        case MaterialTypeDescription():
+            return value.material_type.value
+        case Sequence():
+            items = sorted({canonical(v) for v in value} - {None})
+            if not items:
+                return None
+            return items[0] if len(items) == 1 else tuple(items)
+        case _:
+            return str(value)
+
+
 class QueryBase(BaseModel, frozen=True):
     course: OptionalCourseType = None
     semester: OptionalSemesterType = None
     limit: PositiveInt | None = None
+    offset: NonNegativeInt | None = None
     start_date: PendulumDateTime | None = None
     end_date: PendulumDateTime | None = None
 
+    @cached_property
+    def params(self) -> Mapping[str, ParamValue]:
+        """ Canonical request parameters, unset values omitted """
+        params = ((name, canonical(getattr(self, name))) for name in sorted(type(self).model_fields))
+        return {name: value for name, value in params if value is not None}
+
+    @cached_property
+    def key(self) -> tuple:
+        """ Hashable key, equal for semantically equal queries of the same type """
+        return (type(self).__name__, *self.params.items())
+
+    @cached_property
+    def query_string(self) -> str:
+        return urlencode(self.params, doseq=True)
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, QueryBase):
+            return NotImplemented
+        return self.key == other.key
+
+    def model_copy(self, *, update: Mapping[str, Any] | None = None, deep: bool = False) -> Self:
+        """ Updated fields are validated (and so canonicalized) like constructor arguments """
+        copy = super().model_copy(deep=deep)
+        if update:
+            return type(self).model_validate({name: getattr(copy, name) for name in copy.model_fields_set} | dict(update))
+        for name in ("params", "key", "query_string"):
+            copy.__dict__.pop(name, None)
+        return copy
+
 
 class SimpleMaterialQuery(QueryBase, frozen=True):
     group: OptionalGroupType = None
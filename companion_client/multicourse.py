@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from typing import Any, Literal, NamedTuple, TypeVar
+
+from companion_client.model.course_structure import CourseInstanceSlot
+from companion_client.model.query import CompanionQuery
+from companion_client.timeline import slot_start
+
+T = TypeVar("T")
+Q = TypeVar("Q", bound=CompanionQuery)
+
+type Order = Literal["start_date", "seqno"]
+
+
+class CourseSelection(NamedTuple):
+    course: str
+    semester: str
+    group: str | None = None
+
+
+def order_key(order: Order) -> Callable[[Any], tuple[bool, float]]:
+    """ Sort key for materials and slots; items without a value go last """
+    def key(item: Any) -> tuple[bool, float]:
+        if order == "start_date":
+            value = slot_start(item) if isinstance(item, CourseInstanceSlot) else item.start_date
+            return (value is None, value.timestamp() if value is not None else 0.0)
+        return (item.seqno is None, item.seqno or 0)
+    return key
+
+
+async def _sorted(fetch: Callable[[Q], Awaitable[Sequence[T]]], q: Q,
+                  key: Callable[[T], Any]) -> AsyncIterator[T]:
+    for item in sorted(await fetch(q), key=key):
+        yield item
+
+
+async def merge(streams: Sequence[AsyncIterator[T]], key: Callable[[T], Any],
+                   limit: int | None = None) -> AsyncIterator[T]:
+    """
+    k-way merge of streams that are each ordered by key. The next item of every
+    stream is requested concurrently; the merged stream ends after limit items.
+    """
+    heads = {i: asyncio.ensure_future(anext(s)) for i, s in enumerate(streams)}
+    heap: list[tuple[Any, int, T]] = []
+    count = 0
+    try:
+        while heads or heap:
+            # An item can only be yielded once every live stream has a head on the heap
+            for i, task in list(heads.items()):
+                try:
+                    item = await task
+                except StopAsyncIteration:
+                    del heads[i]
+                    continue
+                heapq.heappush(heap, (key(item), i, item))
+                del heads[i]
+            if not heap:
+                break
+            _, i, item = heapq.heappop(heap)
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                return
+            heads[i] = asyncio.ensure_future(anext(streams[i]))
+    finally:
+        for task in heads.values():
+            task.cancel()
+        await asyncio.gather(*heads.values(), return_exceptions=True)
+        for s in streams:
+            aclose = getattr(s, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+def across(fetch: Callable[[Q], Awaitable[Sequence[T]]], selections: Sequence[CourseSelection], q: Q,
+           order: Order = "start_date", limit: int | None = None) -> AsyncIterator[T]:
+    """
+    Runs q for every selected course concurrently and merges the results by order,
+    up to limit items in total. q.limit still applies per course.
+    """
+    key = order_key(order)
+    streams = [_sorted(fetch, for_course(q, s), key) for s in selections]
+    return merge(streams, key, limit)
+
+
+def for_course(q: Q, selection: CourseSelection) -> Q:
+    """ q for the selected course, validated so that course and semester are canonical """
+    return type(q).model_validate({**q.model_dump(exclude_unset=True), "course": selection.course,
+                                   "semester": selection.semester,
+                                   "group": selection.group if selection.group is not None else q.group})
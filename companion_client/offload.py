@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+_LIST = TypeAdapter(list)
+
+
+# Module level so that they can be sent to a process pool
+
+def parse_model(model: type[M], text: str) -> M:
+    return model.model_validate_json(text)
+
+
+def parse_model_list(model: type[M], text: str) -> list[M]:
+    return [model.model_validate(x) for x in _LIST.validate_json(text)]
+
+
+def parse_ta_list(ta: TypeAdapter[T], text: str) -> list[T]:
+    return [ta.validate_python(x) for x in _LIST.validate_json(text)]
+
+
+@dataclass
+class DecodeStats:
+    inline: int = 0
+    offloaded: int = 0
+    offloaded_bytes: int = 0
+
+
+class Decoder:
+    """
+    Runs response parsers inline or, for responses of at least threshold characters,
+    in executor. A ThreadPoolExecutor helps where parsing releases the GIL (free
+    threaded Python); a ProcessPoolExecutor always keeps the event loop free, at the
+    cost of pickling the parsed models back.
+    """
+
+    def __init__(self, executor: Executor | None = None, threshold: int = 256 << 10):
+        self.executor = executor
+        self.threshold = threshold
+        self.stats = DecodeStats()
+
+    async def __call__(self, parse: Callable[[Any, str], T], target: Any, text: str) -> T:
+        if self.executor is None or len(text) < self.threshold:
+            self.stats.inline += 1
+            return parse(target, text)
+        self.stats.offloaded += 1
+        self.stats.offloaded_bytes += len(text)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parse, target, text)
+
+
+@dataclass
+class StallStats:
+    samples: int = 0
+    stalls: int = 0
+    total: float = 0.0
+    """ Seconds the loop was late beyond the threshold, summed """
+    max: float = 0.0
+
+
+class StallMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping for interval seconds.
+    Lateness above threshold counts as a stall.
+    """
+
+    def __init__(self, interval: float = 0.01, threshold: float = 0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.stats = StallStats()
+        self._task: asyncio.Task | None = None
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            late = time.perf_counter() - start - self.interval
+            self.stats.samples += 1
+            if late > self.threshold:
+                self.stats.stalls += 1
+                self.stats.total += late
+                self.stats.max = max(self.stats.max, late)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
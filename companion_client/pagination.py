@@ -0,0 +1,81 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from dataclasses import dataclass
+
+from companion_client.model.query import QueryBase
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    """ Marks the exception of an abandoned read-ahead request as retrieved """
+    if not future.cancelled():
+        future.exception()
+
+
+@dataclass
+class PageState:
+    """
+    Resumable position of a paginated iteration. It is advanced per consumed item,
+    so passing it to a new iteration continues right after the last item seen.
+    """
+    offset: int = 0
+    consumed: int = 0
+    done: bool = False
+
+
+async def paginate[Q: QueryBase, T](fetch: Callable[[Q], Awaitable[Sequence[T]]], q: Q,
+                                    page_size: int = 500, read_ahead: int = 1,
+                                    state: PageState | None = None) -> AsyncIterator[T]:
+    """
+    Iterates over all results of q page by page, keeping read_ahead further pages in
+    flight while the current one is consumed. q.limit caps the total number of items.
+    Closing the iterator early cancels the outstanding requests; their errors are
+    dropped.
+
+    Iteration also stops at a page longer than requested (the server ignored limit)
+    or equal to the previous one (the server ignored offset).
+    """
+    if page_size <= 0:
+        raise ValueError("page_size must be positive")
+    state = state if state is not None else PageState(offset=q.offset or 0)
+    pending: deque[tuple[asyncio.Future[Sequence[T]], int]] = deque()
+    next_offset = state.offset
+    remaining = None if q.limit is None else q.limit - state.consumed
+
+    def request() -> None:
+        nonlocal next_offset, remaining
+        size = page_size if remaining is None else min(page_size, remaining)
+        if size <= 0:
+            return
+        page = q.model_copy(update={"offset": next_offset, "limit": size})
+        pending.append((asyncio.ensure_future(fetch(page)), size))
+        next_offset += size
+        if remaining is not None:
+            remaining -= size
+
+    previous: Sequence[T] | None = None
+    try:
+        while not state.done:
+            while len(pending) <= read_ahead and (remaining is None or remaining > 0):
+                request()
+            if not pending:
+                state.done = True
+                break
+            future, size = pending.popleft()
+            page = await future
+            if previous is not None and len(page) > 0 and list(page) == list(previous):
+                state.done = True
+                break
+            previous = page
+            for item in page:
+                if q.limit is not None and state.consumed >= q.limit:
+                    break
+                state.offset += 1
+                state.consumed += 1
+                yield item
+            if len(page) != size or (q.limit is not None and state.consumed >= q.limit):
+                state.done = True
+    finally:
+        for f, _ in pending:
+            f.cancel()
+            f.add_done_callback(_retrieve)
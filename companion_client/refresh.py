@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
+
+import httpx
+
+if TYPE_CHECKING:
+    from companion_client.client import PARAMS, CompanionClient
+
+
+@dataclass
+class RefreshStats:
+    refreshed: int = 0
+    failed: int = 0
+    wasted: int = 0
+    """ Refreshed entries that were not read before being refreshed again or dropped """
+    misses_avoided: int = 0
+    """ Reads after an entry's original expiry that a refresh kept in the cache """
+    expired: int = 0
+    """ Cold entries left to expire """
+
+
+class _Entry:
+    __slots__ = ("path", "params", "expires", "due", "score", "last_access", "refreshed", "stale_after")
+
+    def __init__(self, path: str, params: "PARAMS", now: float):
+        self.path = path
+        self.params = params
+        self.expires = 0.0
+        self.due = 0.0
+        self.score = 0.0
+        self.last_access = now
+        self.refreshed = False
+        self.stale_after = math.inf
+
+
+class RefreshScheduler:
+    """
+    Re-fetches hot cache entries of a CompanionClient shortly before they expire.
+
+    Reads are counted with exponential decay (half_life). An entry is hot when its
+    decayed read count is at least min_score when it comes due, lead (plus up to
+    jitter * lead) before expiry. Hot entries are refreshed within a global budget
+    of refreshes per second, at most concurrency at a time; cold entries are left
+    to expire.
+
+    The scheduler attaches itself to the client; run it with start().
+    """
+
+    def __init__(self, client: "CompanionClient", lead: timedelta = timedelta(seconds=30), jitter: float = 0.5,
+                 min_score: float = 2.0, half_life: timedelta = timedelta(minutes=5),
+                 budget: float = 10.0, concurrency: int = 4, max_keys: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        client.refresher = self
+        self.lead = lead.total_seconds()
+        self.jitter = jitter
+        self.min_score = min_score
+        self.half_life = half_life.total_seconds()
+        self.budget = budget
+        self.max_keys = max_keys
+        self.stats = RefreshStats()
+        self._clock = clock
+        self._entries: dict[str, _Entry] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._tokens = budget
+        self._refilled = clock()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+
+    def _decay(self, entry: _Entry, now: float) -> float:
+        return entry.score * math.exp2(-(now - entry.last_access) / self.half_life)
+
+    def record_access(self, key: str) -> None:
+        """ A read served from the cache """
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        now = self._clock()
+        entry.score = self._decay(entry, now) + 1
+        entry.last_access = now
+        entry.refreshed = False
+        if now >= entry.stale_after:
+            # The first read the original response would have missed
+            entry.stale_after = math.inf
+            self.stats.misses_avoided += 1
+
+    def record_fetch(self, key: str, path: str, params: "PARAMS", ttl: float, access: bool = True) -> None:
+        """ A response fetched from the API and stored for ttl seconds """
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_keys:
+                return
+            entry = self._entries[key] = _Entry(path, params, now)
+        if access:
+            # A miss: the entry was not kept alive
+            entry.score = self._decay(entry, now) + 1
+            entry.last_access = now
+            entry.refreshed = False
+            entry.stale_after = math.inf
+        entry.expires = now + ttl
+        entry.due = max(now, entry.expires - self.lead - random.uniform(0, self.jitter * self.lead))
+        heapq.heappush(self._heap, (entry.due, next(self._seq), key))
+        self._wakeup.set()
+
+    def _take_token(self, now: float) -> float:
+        """ Seconds to wait for the budget to allow the next refresh """
+        self._tokens = min(self.budget, self._tokens + (now - self._refilled) * self.budget)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.budget
+
+    async def _refresh(self, key: str, entry: _Entry) -> None:
+        try:
+            if entry.refreshed:
+                self.stats.wasted += 1
+            expires = min(entry.expires, entry.stale_after)
+            try:
+                await self.client._fill(key, entry.path, entry.params, access=False)
+            except httpx.HTTPError:
+                self.stats.failed += 1
+                return
+            entry.refreshed = True
+            entry.stale_after = expires
+            self.stats.refreshed += 1
+        finally:
+            self._slots.release()
+
+    async def refresh_due(self) -> float | None:
+        """
+        Starts refreshes for all entries that are due and returns the seconds until
+        the next one comes due, or None when nothing is queued. Waits for the budget
+        and for a free slot, but not for the refreshes themselves (see join()).
+        """
+        while self._heap:
+            due, _, key = self._heap[0]
+            now = self._clock()
+            if due > now:
+                return due - now
+            heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry.due != due:
+                continue
+            if self._decay(entry, now) < self.min_score:
+                if entry.refreshed:
+                    self.stats.wasted += 1
+                self.stats.expired += 1
+                del self._entries[key]
+                continue
+            while (wait := self._take_token(self._clock())) > 0:
+                await asyncio.sleep(wait)
+            await self._slots.acquire()
+            task = asyncio.create_task(self._refresh(key, entry))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+        return None
+
+    async def join(self) -> None:
+        """ Waits for the refreshes in flight """
+        while self._inflight:
+            await asyncio.wait(self._inflight)
+
+    async def run(self) -> None:
+        """ Processes due entries until cancelled """
+        try:
+            while True:
+                delay = await self.refresh_due()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except TimeoutError:
+                    pass
+        finally:
+            for task in self._inflight:
+                task.cancel()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"keys": len(self._entries), "queued": len(self._heap), **vars(self.stats)}
@@ -0,0 +1,166 @@
+from collections.abc import Callable, Sequence
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from companion_client.model.course_structure import CourseDescription
+from companion_client.model.enum import MaterialType
+from companion_client.model.similarity_search import DocumentChunk
+
+type FloatArray = npt.NDArray[np.float64]
+type IntArray = npt.NDArray[np.int64]
+type Strategy = Callable[[ChunkArrays, float], FloatArray]
+
+
+class ChunkArrays(NamedTuple):
+    """ Columnar view of a batch of document chunks """
+
+    score: FloatArray
+    is_material: npt.NDArray[np.bool_]
+    pos: IntArray
+    pos_end: IntArray
+    qid: IntArray
+    """ Factorized qid; chunks that cannot be merged get a code of their own """
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+
+class RerankResult(NamedTuple):
+    display: list[DocumentChunk]
+    context: list[DocumentChunk]
+
+
+def to_arrays(chunks: Sequence[DocumentChunk]) -> ChunkArrays:
+    n = len(chunks)
+    # Each column is read straight into its array; numpy turns None into NaN
+    score = np.fromiter([c.similarity_score for c in chunks], dtype=np.float64, count=n)
+    score[np.isnan(score)] = -np.inf
+    is_material = np.fromiter([type(c.material_type) is MaterialType for c in chunks], dtype=np.bool_, count=n)
+
+    start = np.fromiter([c.pos for c in chunks], dtype=np.float64, count=n)
+    end = np.fromiter([c.pos_end for c in chunks], dtype=np.float64, count=n)
+    codes: dict[str | None, int] = {}
+    qid = np.fromiter([codes.setdefault(c.qid, len(codes)) for c in chunks], dtype=np.int64, count=n)
+
+    unmergeable = np.isnan(start)
+    if None in codes:
+        unmergeable |= qid == codes[None]
+    start[unmergeable] = 0
+    end = np.where(np.isnan(end), start, np.maximum(start, end))
+    end[unmergeable] = 0
+    qid[unmergeable] = n + np.flatnonzero(unmergeable)
+
+    return ChunkArrays(score, is_material, start.astype(np.int64), end.astype(np.int64), qid)
+
+
+def similarity(a: ChunkArrays, _material_type_weight: float) -> FloatArray:
+    return a.score
+
+
+def material_type(a: ChunkArrays, material_type_weight: float) -> FloatArray:
+    """ Scales the score of course materials (as opposed to Q&A, topics, ...) by the course's weight """
+    return np.where(a.is_material, a.score * material_type_weight, a.score)
+
+
+STRATEGIES: dict[str, Strategy] = {
+    "similarity": similarity,
+    "material_type": material_type,
+    "weighted": material_type,
+}
+
+
+def get_strategy(name: str | None) -> Strategy:
+    """ Unknown strategies are server-side only and fall back to plain similarity """
+    return STRATEGIES.get(name or "similarity", similarity)
+
+
+class Segments(NamedTuple):
+    """ Chunks of the same qid with overlapping ranges, merged into one segment each """
+
+    representative: IntArray
+    """ Index of the best scoring chunk of each segment """
+    score: FloatArray
+    pos: IntArray
+    pos_end: IntArray
+    size: IntArray
+
+
+def merge(a: ChunkArrays, score: FloatArray) -> Segments:
+    n = len(a)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return Segments(empty, np.empty(0, dtype=np.float64), empty, empty, empty)
+
+    # Offsetting positions by qid lets one sort and a single running maximum cover all qids at once
+    low = int(a.pos.min())
+    span = int(a.pos_end.max()) - low + 1
+    offset = a.qid * span - low
+    order = np.argsort(offset + a.pos, kind="stable")
+    base, pos, pos_end = offset[order], a.pos[order], a.pos_end[order]
+    reach = np.maximum.accumulate(base + pos_end)
+    starts = np.empty(n, dtype=np.bool_)
+    starts[0] = True
+    np.greater(base[1:] + pos[1:], reach[:-1], out=starts[1:])
+    bounds = np.flatnonzero(starts)
+
+    # The representative is the first chunk (in sort order) with the best score of its segment
+    seg_score = score[order]
+    seg_score[np.isnan(seg_score)] = -np.inf
+    label = np.cumsum(starts) - 1
+    is_best = seg_score == np.maximum.reduceat(seg_score, bounds)[label]
+    best = np.minimum.reduceat(np.where(is_best, np.arange(n), n), bounds)
+    representative = order[best]
+
+    return Segments(representative=representative,
+                    score=seg_score[best],
+                    pos=np.minimum.reduceat(pos, bounds),
+                    pos_end=np.maximum.reduceat(pos_end, bounds),
+                    size=np.diff(np.append(bounds, n)))
+
+
+def top_k(score: FloatArray, tiebreak: IntArray, k: int | None, threshold: float | None = None,
+          raw_score: FloatArray | None = None) -> IntArray:
+    """ Indices of the k best scores (ties broken by ascending tiebreak), best first """
+    candidates = np.flatnonzero(np.isfinite(score))
+    if threshold is not None:
+        raw = score if raw_score is None else raw_score
+        candidates = candidates[raw[candidates] >= threshold]
+    if k is not None and k < len(candidates):
+        if k <= 0:
+            return candidates[:0]
+        candidates = candidates[np.argpartition(-score[candidates], k - 1)[:k]]
+    return candidates[np.lexsort((tiebreak[candidates], -score[candidates]))]
+
+
+def rerank(chunks: Sequence[DocumentChunk], course: CourseDescription,
+           max_sources_display: int | None = None,
+           max_sources_context: int | None = None) -> RerankResult:
+    """
+    Applies the course's reranking strategy to a batch of chunks, merges overlapping
+    ranges of the same qid and selects the chunks for display and for context.
+
+    Chunks scoring below max_score_sources_display/max_score_sources_context (compared
+    on the raw similarity score) are dropped from the respective list.
+    """
+    a = to_arrays(chunks)
+    score = get_strategy(course.reranking_strategy)(a, course.material_type_weight)
+    seg = merge(a, score)
+    raw = a.score[seg.representative]
+
+    if max_sources_display is None:
+        max_sources_display = course.max_sources_display
+    if max_sources_context is None:
+        max_sources_context = course.max_sources_context
+
+    display = top_k(seg.score, seg.pos, max_sources_display, course.max_score_sources_display, raw)
+    context = top_k(seg.score, seg.pos, max_sources_context, course.max_score_sources_context, raw)
+
+    def chunk(i: int) -> DocumentChunk:
+        c = chunks[seg.representative[i]]
+        if seg.size[i] == 1:
+            return c
+        return c.model_copy(update={"pos": int(seg.pos[i]), "pos_end": int(seg.pos_end[i])})
+
+    return RerankResult(display=[chunk(i) for i in display], context=[chunk(i) for i in context])
@@ -0,0 +1,149 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Sequence
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
+
+import httpx
+from pydantic import ValidationError
+
+from companion_client.model.chat import (
+    ChatStreamingMaterialResponse,
+    ChatStreamingRawResponse,
+    ChatStreamingResponse,
+    ChatStreamingSourcesResponse,
+    StreamingResponseType,
+)
+from companion_client.model.group import MaterialGroup
+from companion_client.model.material import Material
+from companion_client.model.similarity_search import DocumentChunk
+
+if TYPE_CHECKING:
+    from companion_client.client import CompanionClient
+
+MATERIAL_QID = re.compile(r"cis?:[0-9]+")
+
+
+class MaterialResolver:
+    """
+    Shared cache of materials by qid. Unknown qids are fetched in the background
+    with at most concurrency requests in flight; failed lookups resolve to None
+    and are not fetched again for failure_ttl.
+    """
+
+    def __init__(self, client: "CompanionClient", concurrency: int = 8, max_entries: int = 10_000,
+                 failure_ttl: timedelta = timedelta(minutes=1), clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl.total_seconds()
+        self._clock = clock
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._materials: OrderedDict[str, Material] = OrderedDict()
+        self._failed: OrderedDict[str, float] = OrderedDict()
+        self._pending: dict[str, asyncio.Task[Material | None]] = {}
+
+    def get(self, qid: str) -> Material | None:
+        m = self._materials.get(qid)
+        if m is not None:
+            self._materials.move_to_end(qid)
+        return m
+
+    def put(self, material: Material) -> None:
+        self._failed.pop(material.qid, None)
+        self._materials[material.qid] = material
+        self._materials.move_to_end(material.qid)
+        while len(self._materials) > self.max_entries:
+            self._materials.popitem(last=False)
+
+    def invalidate(self, qid: str) -> None:
+        self._materials.pop(qid, None)
+        self._failed.pop(qid, None)
+
+    def _recently_failed(self, qid: str) -> bool:
+        expires = self._failed.get(qid)
+        if expires is None:
+            return False
+        if expires <= self._clock():
+            del self._failed[qid]
+            return False
+        return True
+
+    def schedule(self, qids: Iterable[str]) -> set[str]:
+        """ Starts fetching the given qids that are neither cached nor in flight, returns all resolvable qids """
+        resolvable = set()
+        for qid in qids:
+            if not MATERIAL_QID.fullmatch(qid):
+                continue
+            resolvable.add(qid)
+            if qid not in self._materials and qid not in self._pending and not self._recently_failed(qid):
+                self._pending[qid] = asyncio.create_task(self._fetch(qid))
+        return resolvable
+
+    async def _fetch(self, qid: str) -> Material | None:
+        try:
+            async with self._semaphore:
+                m = await self.client.get_material(qid)
+            if m is not None:
+                self.put(m)
+            return m
+        except (httpx.HTTPError, ValidationError):
+            self._failed[qid] = self._clock() + self.failure_ttl
+            self._failed.move_to_end(qid)
+            while len(self._failed) > self.max_entries:
+                self._failed.popitem(last=False)
+            return None
+        finally:
+            self._pending.pop(qid, None)
+
+    async def wait(self, qids: Iterable[str]) -> dict[str, Material]:
+        """ Waits for the given qids to be resolved """
+        pending = [t for q in qids if (t := self._pending.get(q)) is not None]
+        if pending:
+            # Fetches are shared between chats, so a cancelled waiter must not cancel them
+            await asyncio.wait(pending)
+        return {q: m for q in qids if (m := self.get(q)) is not None}
+
+    def observe(self, event: ChatStreamingResponse) -> set[str]:
+        """ Caches materials delivered with a chat event and schedules missing ones; returns the referenced qids """
+        if isinstance(event, ChatStreamingSourcesResponse):
+            for c in event.value:
+                if c.material is not None:
+                    self.put(c.material)
+            return self.schedule(c.qid for c in event.value if c.qid is not None)
+        if isinstance(event, ChatStreamingMaterialResponse):
+            qids = []
+            for v in event.value:
+                for m in ([*v.materials, *v.more_items] if isinstance(v, MaterialGroup) else [v]):
+                    self.put(m)
+                    qids.append(m.qid)
+            return self.schedule(qids)
+        if isinstance(event, ChatStreamingRawResponse) and isinstance(event.value, list):
+            if event.type == StreamingResponseType.SOURCES:
+                return self._observe_raw([c["material"] if isinstance(c.get("material"), dict) else c
+                                          for c in event.value if isinstance(c, dict)])
+            if event.type == StreamingResponseType.MATERIALS:
+                return self._observe_raw([m for v in event.value if isinstance(v, dict)
+                                          for m in (v.get("materials", []) + v.get("more_items", [])
+                                                    if "qid" not in v else [v])])
+        return set()
+
+    def _observe_raw(self, items: Iterable[Any]) -> set[str]:
+        """ Caches the complete materials among items (dicts as sent) and schedules the ones referenced by qid only """
+        qids = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get("qid"), str):
+                continue
+            try:
+                self.put(Material.model_validate(item))
+            except ValidationError:
+                pass
+            qids.append(item["qid"])
+        return self.schedule(qids)
+
+    def resolve_chunks(self, chunks: Sequence[DocumentChunk]) -> list[DocumentChunk]:
+        """ Chunks with their material filled in from the cache where available """
+        return [c if c.material is not None or c.qid is None or (m := self.get(c.qid)) is None
+                else c.model_copy(update={"material": m})
+                for c in chunks]
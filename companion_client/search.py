@@ -0,0 +1,234 @@
+import asyncio
+import json
+import math
+import re
+import unicodedata
+import zlib
+from bisect import bisect_left, insort
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from companion_client.model.course_structure import CourseTopic, Section
+from companion_client.model.material import Material
+from companion_client.model.query import MaterialQuery
+
+if TYPE_CHECKING:
+    from companion_client.client import CompanionClient
+
+TOKEN = re.compile(r"\w+")
+TITLE_WEIGHT = 2
+
+type FloatArray = npt.NDArray[np.float64]
+type IntArray = npt.NDArray[np.int64]
+
+
+def tokenize(text: str | None) -> list[str]:
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN.findall(text)
+
+
+def topic_key(topic: CourseTopic) -> str:
+    return f"topic:{topic.id}"
+
+
+def section_key(section: Section) -> str:
+    return f"section:{section.seqno}"
+
+
+class SearchHit(NamedTuple):
+    key: str
+    score: float
+
+
+class SearchIndex:
+    """
+    In-memory inverted index with BM25 ranking.
+
+    Documents are identified by a key: the qid for materials, "topic:<id>" for
+    topics and "section:<seqno>" for sections. Title terms count TITLE_WEIGHT times.
+
+    Ids of removed documents are reused, so incremental updates do not grow the
+    index. Postings are scored as numpy arrays, cached per term until it changes.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._keys: list[str | None] = []
+        self._ids: dict[str, int] = {}
+        self._free: list[int] = []
+        self._terms: list[dict[str, int] | None] = []
+        self._lengths: FloatArray = np.zeros(16)
+        self._postings: dict[str, dict[int, int]] = {}
+        self._arrays: dict[str, tuple[IntArray, FloatArray]] = {}
+        self._total_length = 0
+        self._vocabulary: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def add(self, key: str, title: Iterable[str | None] = (), text: Iterable[str | None] = ()) -> None:
+        """ Adds a document, replacing a previous one with the same key """
+        terms = Counter()
+        for t in title:
+            for token in tokenize(t):
+                terms[token] += TITLE_WEIGHT
+        for t in text:
+            terms.update(tokenize(t))
+        self.remove(key)
+        self._insert(key, dict(terms))
+
+    def _insert(self, key: str, terms: dict[str, int]) -> None:
+        if self._free:
+            doc = self._free.pop()
+            self._keys[doc] = key
+            self._terms[doc] = terms
+        else:
+            doc = len(self._keys)
+            self._keys.append(key)
+            self._terms.append(terms)
+            if doc == len(self._lengths):
+                self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths))])
+        length = sum(terms.values())
+        self._lengths[doc] = length
+        self._ids[key] = doc
+        self._total_length += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                self._postings[term] = {doc: tf}
+                insort(self._vocabulary, term)
+            else:
+                postings[doc] = tf
+                self._arrays.pop(term, None)
+
+    def remove(self, key: str) -> None:
+        doc = self._ids.pop(key, None)
+        if doc is None:
+            return
+        terms = self._terms[doc]
+        self._keys[doc] = self._terms[doc] = None
+        self._free.append(doc)
+        self._total_length -= int(self._lengths[doc])
+        self._lengths[doc] = 0
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc]
+            self._arrays.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+
+    def add_material(self, m: Material) -> None:
+        self.add(m.qid, title=(m.title, m.display_title), text=(m.description,))
+
+    def add_topic(self, t: CourseTopic) -> None:
+        self.add(topic_key(t), title=(t.title_de, t.title_en), text=(t.description,))
+
+    def add_section(self, s: Section) -> None:
+        self.add(section_key(s),
+                 title=(s.title_short_de, s.title_short_en, s.title_long_de, s.title_long_en),
+                 text=(s.description_de, s.description_en))
+
+    def expand(self, prefix: str, limit: int = 64) -> list[str]:
+        """ Indexed terms starting with prefix """
+        result = []
+        for i in range(bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            term = self._vocabulary[i]
+            if not term.startswith(prefix) or len(result) == limit:
+                break
+            result.append(term)
+        return result
+
+    def _posting_arrays(self, term: str) -> tuple[IntArray, FloatArray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = self._arrays[term] = (np.fromiter(postings.keys(), np.int64, len(postings)),
+                                           np.fromiter(postings.values(), np.float64, len(postings)))
+        return arrays
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True) -> list[SearchHit]:
+        """ Ranks documents by BM25; with prefix the last query token also matches longer terms """
+        tokens = tokenize(query)
+        if not tokens or not self._ids:
+            return []
+        if prefix and query[-1:].isalnum():
+            alternatives = [[t] for t in tokens[:-1]] + [self.expand(tokens[-1])]
+        else:
+            alternatives = [[t] for t in tokens]
+
+        n = len(self._ids)
+        size = len(self._keys)
+        k1, b = self.k1, self.b
+        # k1-scaled document length normalization: norm0 + norm1 * length
+        norm0, norm1 = k1 * (1 - b), k1 * b / (self._total_length / n or 1)
+        scores = np.zeros(size)
+        for terms in alternatives:
+            terms = [t for t in terms if t in self._postings]
+            best = scores if len(terms) == 1 else np.zeros(size)
+            for term in terms:
+                docs, tf = self._posting_arrays(term)
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                s = idf * (k1 + 1) * tf / (tf + norm0 + norm1 * self._lengths[docs])
+                if best is scores:
+                    scores[docs] += s
+                else:
+                    best[docs] = np.maximum(best[docs], s)
+            if best is not scores:
+                scores += best
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]] if limit > 0 else hits[:0]
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return [SearchHit(self._keys[doc], float(scores[doc])) for doc in hits]  # type: ignore[misc]
+
+    def dumps(self) -> bytes:
+        """ Compact serialized form, loaded with SearchIndex.loads """
+        vocabulary = sorted(self._postings)
+        ids = {t: i for i, t in enumerate(vocabulary)}
+        docs = [[key, [x for term, tf in self._terms[doc].items() for x in (ids[term], tf)]]  # type: ignore[union-attr]
+                for key, doc in self._ids.items()]
+        data = {"k1": self.k1, "b": self.b, "vocabulary": vocabulary, "docs": docs}
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 9)
+
+    @classmethod
+    def loads(cls, data: bytes) -> "SearchIndex":
+        d = json.loads(zlib.decompress(data))
+        index = cls(k1=d["k1"], b=d["b"])
+        vocabulary = d["vocabulary"]
+        for key, flat in d["docs"]:
+            index._insert(key, {vocabulary[flat[i]]: flat[i + 1] for i in range(0, len(flat), 2)})
+        return index
+
+
+def build_index(materials: Sequence[Material] = (), topics: Sequence[CourseTopic] = (),
+                sections: Sequence[Section] = ()) -> SearchIndex:
+    index = SearchIndex()
+    for m in materials:
+        index.add_material(m)
+    for t in topics:
+        index.add_topic(t)
+    for s in sections:
+        index.add_section(s)
+    return index
+
+
+async def index_course(client: "CompanionClient", course: str, semester: str) -> SearchIndex:
+    """ Fetches materials, topics and sections of a course instance and indexes them """
+    materials, topics, sections = await asyncio.gather(
+        client.get_materials(MaterialQuery(course=course, semester=semester)),
+        client.get_topics(course),
+        client.get_sections(course, semester))
+    return build_index(materials, topics, sections)
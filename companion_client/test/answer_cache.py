@@ -0,0 +1,71 @@
+import pytest
+
+from companion_client.answer_cache import AnswerCache, normalize_message
+from companion_client.chat_client import CompanionChatClient
+from companion_client.model.chat import (
+    ChatStreamingChunkResponse,
+    ChatStreamingResponse,
+    ChatStreamingResponseEnd,
+    ChatStreamingSourcesResponse,
+    StreamingResponseType,
+)
+from companion_client.model.similarity_search import DocumentChunk
+from companion_client.test.data import FakeSocket, chat_request, course_description
+
+EVENTS = [ChatStreamingSourcesResponse(value=[DocumentChunk(qid="ci:1", course="MOD")]),
+          ChatStreamingChunkResponse(value="The exam is "),
+          ChatStreamingChunkResponse(value="on Friday."),
+          ChatStreamingResponseEnd()]
+
+
+def test_normalized_questions_hit():
+    assert normalize_message("  When is   the EXAM?? ") == "when is the exam"
+    cache = AnswerCache()
+    cache.put(chat_request("When is the exam?"), EVENTS, [0.1, 0.2, 0.3, 0.4])
+    assert cache.get(chat_request("when is the exam", thread_id="t2")) is not None
+    assert cache.get(chat_request("when is the exam", semester="2024-SS")) is None
+    assert cache.get(chat_request("when is the exam", description=course_description(max_history=8))) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_incomplete_answers_are_not_stored():
+    cache = AnswerCache()
+    cache.put(chat_request("q"), EVENTS[:-1], [0.1, 0.2, 0.3])
+    cache.put(chat_request("q"), [*EVENTS[:-1], ChatStreamingResponse(type=StreamingResponseType.ERROR), EVENTS[-1]],
+              [0.1, 0.2, 0.3, 0.4, 0.5])
+    assert len(cache) == 0
+
+
+def test_invalidation_by_material_and_course():
+    cache = AnswerCache()
+    cache.put(chat_request("a"), EVENTS, [0, 0, 0, 0])
+    cache.put(chat_request("b"), EVENTS[1:], [0, 0, 0])
+    assert cache.invalidate(qid="ci:1") == 1
+    assert cache.invalidate(course="MOD", semester="2024-WS") == 1
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_replay_yields_recorded_events():
+    cache = AnswerCache()
+    cache.put(chat_request("a"), EVENTS, [0, 0.001, 0.002, 0.003])
+    answer = cache.get(chat_request("a"))
+    assert [e async for e in cache.replay(answer, pace=1.0)] == EVENTS
+
+
+def test_parse_dispatches_on_type():
+    event = ChatStreamingResponse.parse(EVENTS[0].model_dump_json())
+    assert isinstance(event, ChatStreamingSourcesResponse) and event.value[0].qid == "ci:1"
+    assert isinstance(ChatStreamingResponse.parse('{"type": "end"}'), ChatStreamingResponseEnd)
+
+
+@pytest.mark.asyncio
+async def test_answer_stored_when_caller_stops_at_end(monkeypatch):
+    socket = FakeSocket([e.model_dump_json() for e in EVENTS])
+    socket.connect(monkeypatch)
+    cache = AnswerCache()
+    chat = CompanionChatClient("http://companion.test/v1", compression=False, answer_cache=cache)
+    async for rsp in chat.chat(chat_request("When is the exam?")):
+        if rsp.type == StreamingResponseType.END:
+            break
+    assert len(cache) == 1 and len(socket.sent) == 1
@@ -0,0 +1,102 @@
+import json
+import random
+from collections import Counter
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from companion_client.balancer import LoadBalancer
+from companion_client.test.data import Clock, mock_client
+
+REPLICAS = ["http://a.test/v1", "http://b.test/v1", "http://c.test/v1"]
+
+
+def test_pick_prefers_fast_endpoints():
+    lb = LoadBalancer(REPLICAS, rng=random.Random(1))
+    for e, latency in zip(lb.endpoints, (0.01, 0.05, 0.5)):
+        lb.observe(e, latency, True)
+    picks = Counter(lb.pick().url for _ in range(300))
+    assert picks["http://c.test/v1"] == 0
+    assert picks["http://a.test/v1"] > picks["http://b.test/v1"]
+
+
+def test_ejection_and_pinning():
+    clock = Clock()
+    lb = LoadBalancer(REPLICAS, failure_threshold=2, ejection_time=timedelta(seconds=10),
+                      max_ejected_fraction=0.5, clock=clock)
+    pinned = {t: lb.pin(t) for t in ("t1", "t2", "t3", "t4", "t5", "t6")}
+    assert all(lb.pin(t) is e for t, e in pinned.items())
+
+    bad = pinned["t1"]
+    lb.observe(bad, 0.1, False)
+    lb.observe(bad, 0.1, False)
+    assert bad not in lb.healthy()
+    assert lb.pin("t1") is not bad
+    assert all(lb.pin(t) is e for t, e in pinned.items() if e is not bad)
+
+    # Ejecting a second replica would exceed max_ejected_fraction
+    other = next(e for e in lb.endpoints if e is not bad)
+    lb.observe(other, 0.1, False)
+    lb.observe(other, 0.1, False)
+    assert other in lb.healthy()
+
+    clock.now += 11
+    assert lb.pin("t1") is bad
+
+
+@pytest.mark.asyncio
+async def test_client_routes_around_failing_replica():
+    hosts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "b.test":
+            return httpx.Response(503)
+        return httpx.Response(200, text=json.dumps(["2024-WS"]))
+
+    client = mock_client(handler, base_url=REPLICAS)
+    for _ in range(60):
+        # Failed GETs are retried on a healthy replica
+        assert await client.get_semesters() == ["2024-WS"]
+    assert hosts.count("b.test") <= client.balancer.failure_threshold
+    assert {"a.test", "c.test"} <= set(hosts)
+
+
+def test_fast_failures_do_not_attract_traffic():
+    lb = LoadBalancer(REPLICAS, failure_threshold=100, rng=random.Random(1))
+    fast_failing, *others = lb.endpoints
+    for e in others:
+        lb.observe(e, 0.05, True)
+    for _ in range(3):
+        lb.observe(fast_failing, 0.001, False)
+    assert fast_failing.ewma >= lb.failure_latency
+    assert fast_failing.url not in {lb.pick().url for _ in range(100)}
+
+
+@pytest.mark.asyncio
+async def test_get_is_retried_on_another_replica():
+    hosts = []
+    refuse = False
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host != "b.test":
+            return httpx.Response(200, text=json.dumps(["2024-WS"]))
+        if refuse:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(503)
+
+    for refuse in (False, True):
+        hosts.clear()
+        client = mock_client(handler, base_url=REPLICAS)
+        for _ in range(30):
+            assert await client.get_semesters() == ["2024-WS"]
+        assert client.balancer.retries == hosts.count("b.test") >= 1
+
+    # Only idempotent requests are retried
+    hosts.clear()
+    client = mock_client(lambda request: hosts.append(request.url.host) or httpx.Response(503), base_url=REPLICAS)
+    with pytest.raises(httpx.HTTPStatusError):
+        await client._fetch("POST", "/semesters")
+    assert client.balancer.retries == 0 and len(hosts) == 1
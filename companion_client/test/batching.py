@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from companion_client.model.enum import MaterialType
+from companion_client.test.data import material, mock_client
+
+
+@pytest.mark.asyncio
+async def test_slot_materials_are_deduplicated_per_tick():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        slot = int(request.url.path.split("/")[3])
+        return httpx.Response(200, text=json.dumps([material(slot)]))
+
+    client = mock_client(handler)
+    results = await asyncio.gather(*(client.get_material_for_courseslot(i % 3 + 1) for i in range(9)),
+                                   client.get_material_for_courseslot(1, MaterialType.SLIDES),
+                                   client.get_material_for_courseslot(1, [MaterialType.SLIDES]))
+    assert [r[0].id for r in results[:3]] == [1, 2, 3]
+    assert sorted(calls) == ["/v1/materials/1", "/v1/materials/1/slides", "/v1/materials/2", "/v1/materials/3"]
+    assert client._slot_materials_loader.batches == 1
+
+    # A later tick is a new batch
+    await client.get_material_for_courseslot(1)
+    assert len(calls) == 5
+
+
+@pytest.mark.asyncio
+async def test_batch_window_and_errors():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(404)
+
+    client = mock_client(handler, batch_window=0.01)
+
+    async def late():
+        await asyncio.sleep(0.001)
+        return await client.get_slot(7)
+
+    results = await asyncio.gather(client.get_slot(7), late(), client.get_slot(8), return_exceptions=True)
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+    assert sorted(calls) == ["/v1/slots/7", "/v1/slots/8"]
+
+
+@pytest.mark.asyncio
+async def test_batching_disabled():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, text="[]")
+
+    client = mock_client(handler, batch_window=None)
+    await asyncio.gather(client.get_material_for_courseslot(1), client.get_material_for_courseslot(1))
+    assert len(calls) == 2
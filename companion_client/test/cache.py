@@ -0,0 +1,95 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from companion_client.cache import MemoryCache, SQLiteCache
+from companion_client.test.data import Clock, mock_client
+
+
+def test_memory_cache_lru_and_ttl():
+    clock = Clock()
+    cache = MemoryCache(max_bytes=10, clock=clock)
+    cache.set("a", b"12345", 60)
+    cache.set("b", b"12345", 60)
+    assert cache.get("a") == b"12345"
+    cache.set("c", b"1", 60)
+    assert cache.get("b") is None and cache.size == 6
+    clock.now += 61
+    assert cache.get("a") is None
+
+
+def test_memory_cache_tags_pruned_with_entries():
+    cache = MemoryCache(max_bytes=10)
+    cache.set("a", b"12345", 60, {"cis:1", "materials"})
+    cache.set("b", b"12345", 60, {"cis:2", "materials"})
+    cache.set("c", b"12345", 60, {"cis:3"})
+    assert set(cache._tagged) == {"cis:2", "cis:3", "materials"}
+    assert cache.delete_tagged(["materials", "cis:1"]) == 1
+    assert set(cache._tagged) == {"cis:3"} and cache.get("c") is not None
+
+
+def test_sqlite_cache_shared_and_bounded(tmp_path: Path):
+    clock = Clock()
+    writer = SQLiteCache(tmp_path / "cache.db", max_bytes=100, clock=clock)
+    reader = SQLiteCache(tmp_path / "cache.db", max_bytes=100, clock=clock)
+    writer.set("a", b"x" * 40, 60)
+    assert reader.get("a") == b"x" * 40
+    writer.set("a", b"y" * 40, 60)
+    assert reader.get("a") == b"y" * 40 and reader.size == 40
+
+    for key in "bcd":
+        clock.now += 1
+        writer.set(key, b"z" * 40, 60)
+    assert reader.size <= 100
+    assert reader.get("a") is None and reader.get("d") is not None
+    clock.now += 61
+    assert reader.get("d") is None
+
+
+def test_sqlite_cache_tags_shared(tmp_path: Path):
+    writer = SQLiteCache(tmp_path / "cache.db")
+    reader = SQLiteCache(tmp_path / "cache.db")
+    writer.set("a", b"x", 60, {"cis:1", "materials"})
+    writer.set("b", b"y", 60, {"cis:2", "materials"})
+    writer.set("b", b"y", 60, {"cis:2"})
+    assert reader.delete_tagged(["materials"]) == 1
+    assert writer.get("a") is None and writer.get("b") == b"y"
+    writer.delete("b")
+    assert writer._connection().execute("SELECT COUNT(*) FROM tags").fetchone()[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_client_serves_cached_responses():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        return httpx.Response(200, text=json.dumps(["2024-WS"]))
+
+    client = mock_client(handler, cache=MemoryCache())
+    assert await client.get_semesters() == await client.get_semesters() == ["2024-WS"]
+    assert len(calls) == 1
+
+    # Another token does not see the responses cached for the first one
+    other = mock_client(handler, cache=client.cache, token="other")
+    await other.get_semesters()
+    assert len(calls) == 2
+
+
+def test_sqlite_cache_contention_skips_writes(tmp_path: Path):
+    cache = SQLiteCache(tmp_path / "cache.db", timeout=0.01)
+    cache.set("a", b"x", 60)
+    writer = sqlite3.connect(tmp_path / "cache.db", isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    try:
+        start = time.perf_counter()
+        assert cache.get("a") == b"x"  # WAL readers are not blocked by the writer
+        cache.set("b", b"y", 60)
+        assert time.perf_counter() - start < 0.5 and cache.busy == 1
+    finally:
+        writer.execute("ROLLBACK")
+    assert cache.get("a") == b"x" and cache.get("b") is None
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from companion_client.cache import MemoryCache
+from companion_client.changes import ChangeEvent, ChangeSubscription, cache_tags
+from companion_client.resolver import MaterialResolver
+from companion_client.search import SearchIndex
+from companion_client.test.data import material, mock_client
+from companion_client.test.timeline import slot
+from companion_client.timeline import SlotTimeline
+
+
+def test_cache_tags():
+    assert cache_tags("/material/cis/1") == {"cis:1"}
+    assert cache_tags("/materials/5/slides") == {"slot:5", "materials", "slot-materials"}
+    assert cache_tags("/slots/MOD/2024-WS/latest") == {"course:MOD", "slots", "slots:MOD"}
+    assert cache_tags("/grouped/by-slot/lecture/MOD/2024-WS") == {"course:MOD", "materials", "materials:MOD"}
+    assert cache_tags("/materials", {"course": "MOD"}) == {"materials", "course:MOD", "materials:MOD"}
+    assert cache_tags("/course/MOD/2024-WS") == {"course:MOD"}
+    assert cache_tags("/semesters") == {"semesters"}
+
+
+def sse(*events: ChangeEvent) -> str:
+    return "".join(f"id: {e.seq}\nevent: change\ndata: {e.model_dump_json()}\n\n" for e in events)
+
+
+@pytest.mark.asyncio
+async def test_subscription_resumes_and_invalidates():
+    feeds = {
+        "0": sse(ChangeEvent(seq=1, kind="material", data=material(1, title="New title")),
+                 ChangeEvent(seq=2, kind="slot", action="deleted", slot_id=2, course="MOD", semester="2024-WS"))
+             + 'data: {"seq": "x", "kind": "unknown"}\n\n',
+        "2": sse(ChangeEvent(seq=2, kind="slot", slot_id=2),
+                 ChangeEvent(seq=3, kind="course", course="MOD", semester="2024-WS")),
+    }
+    connects = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v1/changes":
+            since = request.url.params["since"]
+            connects.append(since)
+            if since not in feeds:
+                return httpx.Response(503)
+            return httpx.Response(200, text=feeds[since], headers={"Content-Type": "text/event-stream"})
+        if request.url.path.startswith("/v1/material/"):
+            return httpx.Response(200, text=json.dumps(material(1)))
+        if request.url.path.startswith("/v1/materials/"):
+            return httpx.Response(200, text=json.dumps([material(1)]))
+        if request.url.path == "/v1/course/MOD":
+            return httpx.Response(200, text="{}")
+        return httpx.Response(200, text=json.dumps(["2024-WS"]))
+
+    cache = MemoryCache()
+    client = mock_client(handler, cache=cache)
+    # Entries filled by another client sharing the cache are invalidated as well
+    await mock_client(handler, cache=cache).get_material("cis:1")
+    await client.get_material_for_courseslot(5)
+    await client.get_semesters()
+    await client._get("/course/MOD")
+    assert len(cache._entries) == 4
+
+    resolver = MaterialResolver(client)
+    index = SearchIndex()
+    index.add_material(client_material := await client.get_material("cis:1"))
+    timeline = SlotTimeline([slot(1, "2024-10-01T10:00:00+02:00"), slot(2, "2024-10-08T10:00:00+02:00")])
+    subscription = ChangeSubscription(client, resolver=resolver, timelines={("MOD", "2024-WS"): timeline},
+                                      indexes={("MOD", "2024-WS"): index}, retry=timedelta(milliseconds=1))
+    seen = []
+    async for event in subscription.events():
+        subscription.apply(event)
+        seen.append(event.seq)
+        if event.seq == 1:
+            keys = set(cache._entries)
+            assert not any(k.endswith("material/cis/1?") or "materials/5" in k for k in keys)
+            assert resolver.get("cis:1").title == "New title" != client_material.title
+            assert index.search("new")[0].key == "cis:1"
+        if event.seq == 2:
+            assert len(timeline) == 1
+        if event.seq == 3:
+            break
+
+    assert seen == [1, 2, 3]
+    assert connects == ["0", "2"] and subscription.skipped == 1
+    assert [k for k in cache._entries] == ["http://companion.test/v1/semesters?"]
+
+
+@pytest.mark.asyncio
+async def test_subscription_uses_replicas_and_survives_failing_events():
+    feed = sse(*(ChangeEvent(seq=i, kind="course", course="MOD") for i in (1, 2, 3)))
+    hosts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "a.test":
+            return httpx.Response(503)
+        return httpx.Response(200, text=feed, headers={"Content-Type": "text/event-stream"})
+
+    client = mock_client(handler, base_url=["http://a.test/v1", "http://b.test/v1"])
+    subscription = ChangeSubscription(client, retry=timedelta(milliseconds=1))
+    done = asyncio.Event()
+
+    def listener(event: ChangeEvent) -> None:
+        if event.seq == 2:
+            raise RuntimeError("listener failed")
+        if event.seq == 3:
+            done.set()
+
+    subscription.add_listener(listener)
+    subscription.start()
+    try:
+        await asyncio.wait_for(done.wait(), 1)
+    finally:
+        await subscription.stop()
+    assert subscription.errors == 1 and subscription.seq == 3
+    assert set(hosts) <= {"a.test", "b.test"} and hosts[-1] == "b.test"
+    assert client.balancer.endpoints[0].failures == hosts.count("a.test")
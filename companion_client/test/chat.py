@@ -0,0 +1,53 @@
+import gc
+import json
+
+import pytest
+
+from companion_client.chat_client import CompanionChatClient
+from companion_client.model import chat
+from companion_client.model.chat import ChatStreamingChunkResponse, ChatStreamingRawResponse, StreamingResponseType
+from companion_client.test.data import FakeSocket, chat_request, course_description
+
+
+def test_to_json_matches_model_dump():
+    request = chat_request("What is a Petri net?")
+    assert json.loads(request.to_json()) == json.loads(request.model_dump_json())
+
+    other = chat_request("What is a Petri net?", course_description=course_description(max_history=2))
+    assert json.loads(other.to_json()) == json.loads(other.model_dump_json())
+
+
+def test_to_json_after_course_changed():
+    description = course_description()
+    request = chat_request("What is a Petri net?", description=description)
+    request.to_json()
+    description.max_history = 7
+    description.functions.append("search")
+    assert json.loads(request.to_json()) == json.loads(request.model_dump_json())
+    assert json.loads(request.to_json())["course_desc"]["functions"] == ["search"]
+
+
+def test_course_json_released_with_course():
+    description = course_description()
+    chat.course_json(description)
+    assert id(description) in chat._course_json
+    key = id(description)
+    del description
+    gc.collect()
+    assert key not in chat._course_json
+
+
+@pytest.mark.asyncio
+async def test_partial_events_do_not_abort_the_chat(monkeypatch):
+    messages = [{"type": "materials", "value": [{"qid": "cis:1"}]},
+                {"type": "sources", "value": [{"qid": "cis:1", "content": "Petri nets"}]},
+                {"type": "streaming", "value": "A Petri net"},
+                {"type": "response", "value": "A Petri net"},
+                {"type": "end"}]
+    FakeSocket([json.dumps(m) for m in messages]).connect(monkeypatch)
+    client = CompanionChatClient("http://companion.test/v1", compression=False)
+    events = [e async for e in client.chat(chat_request("What is a Petri net?"))]
+    assert [e.type for e in events] == [StreamingResponseType(m["type"]) for m in messages]
+    assert isinstance(events[0], ChatStreamingRawResponse) and events[0].value == [{"qid": "cis:1"}]
+    assert isinstance(events[2], ChatStreamingChunkResponse)
+    assert json.loads(events[1].model_dump_json()) == messages[1]
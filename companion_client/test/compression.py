@@ -0,0 +1,37 @@
+import gzip
+import json
+
+import httpx
+import pytest
+
+from companion_client.compression import accept_encoding, deflate_session
+from companion_client.test.data import Stream, mock_client
+
+
+@pytest.mark.asyncio
+async def test_gzip_response_is_decoded_and_measured():
+    body = json.dumps(["2024-WS", "2024-SS"] * 100).encode()
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["accept-encoding"])
+        return httpx.Response(200, stream=Stream(gzip.compress(body)), headers={"content-encoding": "gzip"})
+
+    client = mock_client(handler, compression=["gzip"])
+    assert len(await client.get_semesters()) == 200
+    assert seen == ["gzip"]
+    stats = client.compression_stats.http["gzip"]
+    assert stats.responses == 1 and stats.decoded_bytes == len(body) and stats.ratio > 10
+
+
+def test_accept_encoding_filters_unsupported():
+    assert accept_encoding(["unknown", "gzip", "deflate"]) == "gzip, deflate;q=0.9"
+    assert accept_encoding([]) == "identity"
+
+
+def test_deflate_session_enables_extension():
+    class Response:
+        headers = {"sec-websocket-extensions": "permessage-deflate; client_max_window_bits=12"}
+
+    session = deflate_session()(object(), response=Response())
+    assert [e.name for e in session.connection._proto.extensions] == ["permessage-deflate"]
@@ -0,0 +1,90 @@
+from collections.abc import Awaitable, Callable, Sequence
+from contextlib import asynccontextmanager
+from typing import Any
+
+import httpx
+
+from companion_client.client import CompanionClient
+from companion_client.model.chat import ChatStreamingRequest
+from companion_client.model.course_structure import CourseDescription
+
+BASE_URL = "http://companion.test/v1"
+
+type Handler = Callable[[httpx.Request], httpx.Response | Awaitable[httpx.Response]]
+
+
+def mock_client(handler: Handler | httpx.AsyncBaseTransport, base_url: str | list[str] = BASE_URL,
+                **kwargs) -> CompanionClient:
+    """ A CompanionClient whose requests are answered by handler """
+    transport = handler if isinstance(handler, httpx.AsyncBaseTransport) else httpx.MockTransport(handler)
+    return CompanionClient(base_url=base_url, transport=transport, **kwargs)
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Stream(httpx.AsyncByteStream):
+    """ A streamed response body, delivered in chunks of chunk_size """
+
+    def __init__(self, data: bytes, chunk_size: int = 4096):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for i in range(0, len(self.data), self.chunk_size):
+            yield self.data[i:i + self.chunk_size]
+
+
+class FakeSocket:
+    """ Stands in for the chat WebSocket, answering every request with messages """
+
+    def __init__(self, messages: Sequence[str]):
+        self.messages = list(messages)
+        self.sent: list[str] = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(text)
+
+    async def receive_text(self) -> str:
+        return self.messages.pop(0)
+
+    def connect(self, monkeypatch: Any) -> None:
+        """ Routes CompanionChatClient connections to this socket """
+        @asynccontextmanager
+        async def aconnect_ws(url: str, *args, **kwargs):
+            yield self
+        monkeypatch.setattr("companion_client.chat_client.aconnect_ws", aconnect_ws)
+
+
+def course_description(**kwargs) -> CourseDescription:
+    values = dict(course_short="MOD", course_long="Modeling", default_language="de", proper_course=True,
+                  has_slots=True, has_bot=True, has_sections=True, has_topics=True, show_qa=True,
+                  max_sources_raw=50, max_sources_context=10, max_score_sources_context=0.0,
+                  max_topic_suggestions_history=2, max_question_suggestions_history=2,
+                  material_type_weight=1.0, history_ttl_minutes=60, max_history=4,
+                  group_sources=False, prompt_for_info=False, prompt_for_info_continue=False,
+                  condense_history=False, check_slot_prompt=False, rewrite_query=False)
+    return CourseDescription(**(values | kwargs))
+
+
+def chat_request(message: str, description: CourseDescription | None = None, **kwargs) -> ChatStreamingRequest:
+    description = description or course_description()
+    values = dict(course_description=description, course_desc=description, course="MOD", semester="2024-WS",
+                  user_id="u1", thread_id="t1", req_id="r1", message=message)
+    return ChatStreamingRequest(**(values | kwargs))
+
+
+def material(i: int, **kwargs) -> dict:
+    values = {"id": i, "qid": f"cis:{i}", "title": f"Material {i}",
+              "display_title_": f"Material {i}", "display_title_compact_": f"M{i}", "display_description_": "",
+              "material_type": {"id": 1, "material_type": "slides", "material_long_de": "Folien",
+                                "material_long_en": "Slides", "slot_specific": True},
+              "seqno": 1, "section_title": None, "section_title_compact": None,
+              "course": "MOD", "course_long": "Modeling", "semester": "2024-WS",
+              "slot_type": None, "groups": None, "indexing_strategy": "standard"}
+    return values | kwargs
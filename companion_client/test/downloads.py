@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+import httpx
+import pendulum
+import pytest
+
+from companion_client.downloads import Downloader, Validators, due
+from companion_client.model.material import Material
+from companion_client.test.data import Stream, material, mock_client
+
+FILE = bytes(range(256)) * 100
+
+
+
+def slides(i: int, **kwargs) -> Material:
+    return Material.model_validate(material(i, **({"full_url": f"https://files{i % 2}.test/{i}.pdf"} | kwargs)))
+
+
+def test_due_orders_by_next_index_time():
+    now = pendulum.datetime(2024, 11, 1)
+    materials = [slides(1, last_indexed="2024-10-30T00:00:00Z", reindex_interval=1),
+                 slides(2, last_indexed="2024-10-31T12:00:00Z", reindex_interval=1),
+                 slides(3),
+                 slides(4, last_indexed="2024-10-01T00:00:00Z"),
+                 slides(5, no_indexing=True),
+                 slides(6, last_indexed="2024-10-25T00:00:00Z", reindex_interval=1)]
+    assert [m.id for m in due(materials, now)] == [3, 6, 1]
+
+
+@pytest.mark.asyncio
+async def test_download_skip_and_resume(tmp_path: Path):
+    requests: list[httpx.Request] = []
+    active: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        if (r := request.headers.get("range")) and request.headers.get("if-range") == '"v1"':
+            start = int(r.removeprefix("bytes=").removesuffix("-"))
+            return httpx.Response(206, headers={"ETag": '"v1"'}, stream=Stream(FILE[start:]))
+        return httpx.Response(200, headers={"ETag": '"v1"'}, stream=Stream(FILE))
+
+    client = mock_client(handler, token="secret")
+    downloader = Downloader(client, tmp_path, per_host=2)
+    materials = [slides(i) for i in range(8)]
+    results = [r async for _, r in downloader.download_due(materials)]
+    assert {r.status for r in results} == {"downloaded"}
+    assert {r.digest for r in results} == {hashlib.sha256(FILE).hexdigest()}
+    assert results[0].path.read_bytes() == FILE
+    assert max(peak.values()) <= 2
+    assert all("authorization" not in r.headers for r in requests)
+
+    again = await downloader.download(materials[0].full_url)
+    assert again.status == "unchanged" and again.bytes == 0
+
+    # An interrupted download of a new URL resumes where it stopped
+    url = "https://files0.test/new.pdf"
+    partial = downloader.store.start_partial(url, Validators(etag='"v1"'))
+    partial.write_bytes(FILE[:1000])
+    resumed = await downloader.download(url)
+    assert resumed.status == "resumed" and resumed.bytes == len(FILE) - 1000
+    assert resumed.path.read_bytes() == FILE
+
+
+@pytest.mark.asyncio
+async def test_shared_and_redirected_urls(tmp_path: Path):
+    requests: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(str(request.url))
+        await asyncio.sleep(0.01)
+        if request.url.path == "/moved.pdf":
+            return httpx.Response(302, headers={"Location": "https://files1.test/1.pdf"})
+        return httpx.Response(200, headers={"ETag": '"v1"'}, stream=Stream(FILE))
+
+    downloader = Downloader(mock_client(handler), tmp_path)
+    materials = [slides(1), slides(2, full_url="https://files1.test/1.pdf")]
+    results = [(m.id, r) async for m, r in downloader.download_due(materials)]
+    assert sorted(i for i, _ in results) == [1, 2] and results[0][1] is results[1][1]
+    assert requests == ["https://files1.test/1.pdf"]
+
+    # Concurrent downloads of one URL take turns instead of sharing the partial file
+    both = await asyncio.gather(downloader.download("https://files0.test/2.pdf"),
+                                downloader.download("https://files0.test/2.pdf"))
+    assert [r.status for r in both] == ["downloaded", "downloaded"]
+    assert both[1].path.read_bytes() == FILE and not downloader._urls
+
+    moved = await downloader.download("https://files0.test/moved.pdf")
+    assert moved.status == "downloaded" and moved.path.read_bytes() == FILE
+    assert requests[-2:] == ["https://files0.test/moved.pdf", "https://files1.test/1.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_unsatisfiable_range(tmp_path: Path):
+    ranges: list[str | None] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        ranges.append(r := request.headers.get("range"))
+        if r and int(r.removeprefix("bytes=").removesuffix("-")) >= len(FILE):
+            return httpx.Response(416, headers={"Content-Range": f"bytes */{len(FILE)}"})
+        return httpx.Response(200, headers={"ETag": '"v1"'}, stream=Stream(FILE))
+
+    downloader = Downloader(mock_client(handler), tmp_path)
+
+    # A complete partial file that was never committed is committed without a transfer
+    url = "https://files0.test/complete.pdf"
+    downloader.store.start_partial(url, Validators(etag='"v1"')).write_bytes(FILE)
+    result = await downloader.download(url)
+    assert result.status == "resumed" and result.bytes == 0 and result.path.read_bytes() == FILE
+    assert result.digest == hashlib.sha256(FILE).hexdigest()
+
+    # A partial file longer than the file is discarded and downloaded again
+    url = "https://files0.test/longer.pdf"
+    downloader.store.start_partial(url, Validators(etag='"v1"')).write_bytes(FILE + b"x")
+    result = await downloader.download(url)
+    assert result.status == "downloaded" and result.path.read_bytes() == FILE
+    assert ranges == [f"bytes={len(FILE)}-", f"bytes={len(FILE) + 1}-", None]
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from companion_client.history import ChatHistoryStore
+from companion_client.model.chat_messages import GPTAIMessage, GPTHumanMessage
+from companion_client.model.similarity_search import DocumentChunk
+from companion_client.test.data import Clock
+
+
+def human(content: str) -> GPTHumanMessage:
+    return GPTHumanMessage(timestamp=datetime(2024, 10, 1), content=content)
+
+
+def ai(content: str, *qids: str) -> GPTAIMessage:
+    return GPTAIMessage(timestamp=datetime(2024, 10, 1), content=content,
+                        documents=[DocumentChunk(qid=q, pos=0, pos_end=10, course="MOD") for q in qids])
+
+
+def test_ring_buffer_and_shared_documents():
+    store = ChatHistoryStore(max_history=2, clock=Clock(0.0))
+    store.append("t1", human("q1"))
+    store.append("t1", ai("a1", "ci:1"))
+    store.append("t2", ai("a1", "ci:1"))
+    assert len(store.documents) == 1
+
+    store.append("t1", human("q2"))
+    history = store.get("t1")
+    assert [m.content for m in history] == ["a1", "q2"]
+    assert history[0].documents[0].qid == "ci:1"
+
+    store.append("t1", human("q3"))
+    store.discard("t2")
+    assert len(store.documents) == 0
+
+
+def test_ttl_pruning():
+    clock = Clock(0.0)
+    store = ChatHistoryStore(ttl=timedelta(minutes=1), clock=clock)
+    store.append("t1", human("q1"))
+    store.append("t2", human("q1"), ttl=timedelta(minutes=5))
+    clock.now = 30
+    store.get("t1")
+    clock.now = 80
+    assert store.prune() == 0
+    clock.now = 100
+    assert store.prune() == 1
+    assert "t1" not in store and "t2" in store
+    clock.now = 1000
+    assert store.get("t2") == []
+    assert len(store) == 0
+
+
+def test_max_threads():
+    store = ChatHistoryStore(max_threads=2, clock=Clock(0.0))
+    for t in ("t1", "t2", "t3"):
+        store.append(t, human("q"))
+    assert "t1" not in store and len(store) == 2
+
+
+def test_no_history():
+    store = ChatHistoryStore(max_history=0, clock=Clock(0.0))
+    store.append("t1", ai("a1", "ci:1"))
+    assert store.get("t1") == [] and len(store.documents) == 0
+
+    store = ChatHistoryStore(max_history=2, clock=Clock(0.0))
+    store.append("t1", human("q1"))
+    store.append("t1", human("q2"), max_history=0)
+    assert store.get("t1") == []
+
+
+def test_max_bytes():
+    store = ChatHistoryStore(max_history=4, max_bytes=2000, clock=Clock(0.0))
+    store.append("t1", ai("a" * 300, "ci:1"))
+    store.append("t2", ai("b" * 300, "ci:1"))
+    assert len(store.documents) == 1
+    size = store.size
+    assert 600 < size < 2000
+
+    # Emptying the ring buffer returns its bytes
+    store.append("t2", human("q"), max_history=0)
+    assert store.size < size
+
+    store.append("t3", human("c" * 1200))
+    assert "t1" not in store and "t2" in store and "t3" in store
+    assert store.size <= 2000
+
+    # A single thread over the budget is kept
+    store.append("t3", human("d" * 3000))
+    assert len(store) == 1 and "t3" in store and len(store.documents) == 0
+    store.discard("t3")
+    assert store.size == 0
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from companion_client.model.query import MaterialQuery
+from companion_client.multicourse import CourseSelection, for_course, merge
+from companion_client.test.data import material, mock_client
+
+
+async def stream(values):
+    for v in values:
+        await asyncio.sleep(0)
+        yield v
+
+
+@pytest.mark.asyncio
+async def test_merge_is_ordered_and_stops_at_limit():
+    merged = [v async for v in merge([stream([1, 4, 7]), stream([2, 5]), stream([]), stream([3, 6, 9])],
+                                     key=lambda v: v)]
+    assert merged == [1, 2, 3, 4, 5, 6, 7, 9]
+
+    closed = []
+
+    async def endless(start):
+        try:
+            while True:
+                yield start
+                start += 2
+        finally:
+            closed.append(start)
+
+    assert [v async for v in merge([endless(0), endless(1)], key=lambda v: v, limit=5)] == [0, 1, 2, 3, 4]
+    assert len(closed) == 2
+
+
+@pytest.mark.asyncio
+async def test_materials_across_courses_concurrently():
+    courses = {"MOD": [3, 1], "ALG": [2], "DB": [5, 4]}
+    queries = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        course = request.url.params["course"]
+        assert request.url.params["semester"] == "2024-WS"
+        queries.append((course, request.url.params.get("group")))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, text=json.dumps(
+            [material(i, course=course, seqno=i, start_date=f"2024-10-0{i}T10:00:00+02:00") for i in courses[course]]))
+
+    client = mock_client(handler)
+    selections = [CourseSelection("mod", "ws24", "a"), CourseSelection("ALG", "2024-WS"),
+                  CourseSelection("DB", "2024-WS")]
+
+    start = time.perf_counter()
+    merged = [m async for m in client.get_materials_across(selections, limit=4)]
+    assert time.perf_counter() - start < 0.12
+    assert [(m.course, m.id) for m in merged] == [("MOD", 1), ("ALG", 2), ("MOD", 3), ("DB", 4)]
+    assert sorted(queries) == [("ALG", None), ("DB", None), ("MOD", "a")]
+
+    by_seqno = [m.seqno async for m in client.get_materials_across(selections, order="seqno")]
+    assert by_seqno == [1, 2, 3, 4, 5]
+
+
+def test_for_course_is_canonical():
+    q = MaterialQuery(material_type="slides", limit=5)
+    assert for_course(q, CourseSelection("mod", "ws24")) == MaterialQuery(course="MOD", semester="2024-WS",
+                                                                           material_type="slides", limit=5)
@@ -0,0 +1,47 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from companion_client.model.query import MaterialQuery
+from companion_client.offload import StallMonitor
+from companion_client.test.data import material, mock_client
+
+
+def material_list(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, text=json.dumps([material(i) for i in range(50)]))
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_decoded_off_loop():
+    with ThreadPoolExecutor(1) as executor:
+        client = mock_client(material_list, decode_executor=executor, decode_threshold=1 << 10)
+        materials = await client.get_materials(MaterialQuery(course="MOD"))
+        assert [m.id for m in materials] == list(range(50))
+        assert client.decoder.stats.offloaded == 1 and client.decoder.stats.inline == 0
+
+    client = mock_client(material_list, decode_executor=None, decode_threshold=1 << 10)
+    await client.get_materials(MaterialQuery(course="MOD"))
+    assert client.decoder.stats.offloaded == 0 and client.decoder.stats.inline == 1
+
+
+@pytest.mark.asyncio
+async def test_process_pool_decoding():
+    with ProcessPoolExecutor(1) as executor:
+        client = mock_client(material_list, decode_executor=executor, decode_threshold=1 << 10)
+        materials = await client.get_materials(MaterialQuery(course="MOD"))
+        assert materials[3].qid == "cis:3"
+
+
+@pytest.mark.asyncio
+async def test_stall_monitor():
+    monitor = StallMonitor(interval=0.005, threshold=0.02)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.06)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+    assert monitor.stats.stalls >= 1 and monitor.stats.max >= 0.04
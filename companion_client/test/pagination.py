@@ -0,0 +1,110 @@
+import asyncio
+import gc
+import json
+from contextlib import aclosing
+
+import httpx
+import pytest
+
+from companion_client.client import CompanionClient
+from companion_client.model.query import SlotQuery
+from companion_client.pagination import PageState, paginate
+from companion_client.test.data import mock_client
+
+SLOT_TYPE = {"id": "lecture", "title_short_de": "V", "title_short_en": "L",
+             "title_long_de": "Vorlesung", "title_long_en": "Lecture"}
+
+
+def slot(i: int) -> dict:
+    return {"id": i, "course": "MOD", "semester": "2024-WS", "slot_type": SLOT_TYPE}
+
+
+def slot_client(total: int, requested: list[int]) -> CompanionClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+        requested.append(offset)
+        return httpx.Response(200, text=json.dumps([slot(i) for i in range(offset, min(offset + limit, total))]))
+
+    client = mock_client(handler)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_paginate_all_pages():
+    requested: list[int] = []
+    client = slot_client(25, requested)
+    ids = [s.id async for s in client.paginate_slots(SlotQuery(course="MOD", semester="2024-WS"), page_size=10)]
+    assert ids == list(range(25))
+    assert requested[:3] == [0, 10, 20]
+
+
+@pytest.mark.asyncio
+async def test_paginate_limit_and_resume():
+    requested: list[int] = []
+    client = slot_client(100, requested)
+    q = SlotQuery(course="MOD", semester="2024-WS")
+    state = PageState()
+    async with aclosing(client.paginate_slots(q, page_size=10, read_ahead=2, state=state)) as it:
+        async for s in it:
+            if s.id == 14:
+                break
+    await asyncio.sleep(0)
+    assert state.offset == 15 and not state.done
+    assert max(requested) <= 30
+
+    rest = [s.id async for s in client.paginate_slots(q.model_copy(update={"limit": 5}), page_size=10, state=PageState(offset=state.offset))]
+    assert rest == [15, 16, 17, 18, 19]
+
+
+@pytest.mark.asyncio
+async def test_paginate_stops_when_server_ignores_paging():
+    sizes: list[int] = []
+
+    def ignore_offset(request: httpx.Request) -> httpx.Response:
+        limit = int(request.url.params["limit"])
+        sizes.append(limit)
+        return httpx.Response(200, text=json.dumps([slot(i) for i in range(limit)]))
+
+    def ignore_both(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=json.dumps([slot(i) for i in range(25)]))
+
+    q = SlotQuery(course="MOD", semester="2024-WS")
+    for handler, expected in ((ignore_offset, 10), (ignore_both, 25)):
+        client = mock_client(handler)
+        assert len([s async for s in client.paginate_slots(q, page_size=10)]) == expected
+
+    # Pages are not larger than what is left of q.limit
+    def record_limit(request: httpx.Request) -> httpx.Response:
+        sizes.append(int(request.url.params["limit"]))
+        offset = int(request.url.params["offset"])
+        return httpx.Response(200, text=json.dumps([slot(i) for i in range(offset, offset + sizes[-1])]))
+
+    sizes.clear()
+    client = mock_client(record_limit)
+    ids = [s.id async for s in client.paginate_slots(q.model_copy(update={"limit": 7}), page_size=5)]
+    assert ids == list(range(7)) and sizes == [5, 2]
+
+
+
+@pytest.mark.asyncio
+async def test_abandoned_read_ahead_errors_are_retrieved():
+    async def fetch(q: SlotQuery) -> list[int]:
+        if not q.offset:
+            return list(range(q.limit))
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # e.g. a transport that turns cancellation into its own error
+            raise ConnectionResetError from None
+        return []
+
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+    async with aclosing(paginate(fetch, SlotQuery(course="MOD", semester="2024-WS"), page_size=10,
+                                 read_ahead=2)) as it:
+        async for _ in it:
+            await asyncio.sleep(0)
+            break
+    await asyncio.sleep(0)
+    gc.collect()
+    assert errors == []
@@ -0,0 +1,41 @@
+import pendulum
+import pytest
+from pydantic import ValidationError
+
+from companion_client.model.enum import MaterialType, SlotType
+from companion_client.model.query import MaterialQuery, SimpleMaterialQuery, SlotQuery
+
+
+def test_equivalent_queries_share_key():
+    a = MaterialQuery(course="mod", semester="ws24", group="a", material_type=[MaterialType.SLIDES, MaterialType.BOARD])
+    b = MaterialQuery(course="MOD", semester="2024-WS", group=["a"], material_type=["board", "slides", "board"])
+    assert a == b
+    assert hash(a) == hash(b)
+    assert len({a, b}) == 1
+    assert a.query_string == "course=MOD&group=a&material_type=board&material_type=slides&semester=2024-WS"
+
+
+def test_query_types_differ():
+    assert SlotQuery(course="MOD") != MaterialQuery(course="MOD")
+    assert SlotQuery(course="MOD", slot_type=SlotType.LECTURE) != SlotQuery(course="MOD")
+
+
+def test_params_are_wire_values():
+    q = SimpleMaterialQuery(course="MOD", semester="2024-WS", start_date=pendulum.datetime(2024, 10, 1))
+    assert q.params == {"aggregate": "false", "course": "MOD", "semester": "2024-WS",
+                        "start_date": "2024-10-01T00:00:00Z"}
+
+
+def test_model_copy_recomputes_key():
+    q = SlotQuery(course="MOD", limit=10)
+    assert q.key
+    assert q.model_copy(update={"limit": 20}).params["limit"] == 20
+
+
+def test_model_copy_validates_updates():
+    q = MaterialQuery(course="MOD", material_type="slides").model_copy(
+        update={"course": "mod", "semester": "ws24", "group": ["b", "a", "b"]})
+    assert q == MaterialQuery(course="MOD", semester="2024-WS", group=["a", "b"], material_type=MaterialType.SLIDES)
+    assert q.course == "MOD" and q.semester == "2024-WS"
+    with pytest.raises(ValidationError):
+        q.model_copy(update={"limit": 0})
@@ -0,0 +1,98 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from companion_client.cache import MemoryCache
+from companion_client.refresh import RefreshScheduler
+from companion_client.test.data import Clock, mock_client
+
+
+@pytest.mark.asyncio
+async def test_refreshes_hot_keys_and_drops_cold_ones():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, text=json.dumps(["2024-WS"] if request.url.path.endswith("semesters") else []))
+
+    clock = Clock()
+    client = mock_client(handler, cache=MemoryCache(clock=clock), cache_ttl=30)
+    refresher = RefreshScheduler(client, lead=timedelta(seconds=20), jitter=0, min_score=2, clock=clock)
+    for _ in range(3):
+        await client.get_semesters()
+    await client.get_courses()
+    assert len(calls) == 2
+    assert await refresher.refresh_due() == pytest.approx(10)
+
+    clock.now += 10
+    assert await refresher.refresh_due() is None
+    await refresher.join()
+    assert await refresher.refresh_due() == pytest.approx(10)
+    assert refresher.stats.refreshed == 1 and refresher.stats.expired == 1
+    assert len(refresher) == 1
+
+    # A read before the original expiry would have hit anyway
+    await client.get_semesters()
+    assert refresher.stats.misses_avoided == 0
+
+    # The hot key survives its original expiry without a miss
+    clock.now += 25
+    await client.get_semesters()
+    assert len(calls) == 3
+    assert refresher.stats.misses_avoided == 1
+    await client.get_semesters()
+    assert refresher.stats.misses_avoided == 1
+
+    # Unread after a refresh: the next refresh is counted as wasted
+    clock.now += 5
+    await refresher.refresh_due()
+    await refresher.join()
+    clock.now += 10
+    await refresher.refresh_due()
+    await refresher.join()
+    assert refresher.stats.refreshed == 3 and refresher.stats.wasted == 1
+
+
+@pytest.mark.asyncio
+async def test_refreshes_run_concurrently():
+    release = asyncio.Event()
+    active = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await release.wait()
+        active -= 1
+        return httpx.Response(200, text='"de"')
+
+    clock = Clock()
+    client = mock_client(handler, cache=MemoryCache(clock=clock), cache_ttl=30)
+    refresher = RefreshScheduler(client, lead=timedelta(seconds=20), jitter=0, min_score=0.5, concurrency=2, clock=clock)
+    release.set()
+    for course in ("gdi", "mod", "prog"):
+        await client.get_default_lang(course)
+    release.clear()
+
+    clock.now += 10
+    refreshing = asyncio.create_task(refresher.refresh_due())
+    for _ in range(10):
+        await asyncio.sleep(0)
+    # Two refreshes in flight, the third waits for a slot
+    assert peak == 2 and not refreshing.done()
+    release.set()
+    await refreshing
+    await refresher.join()
+    assert refresher.stats.refreshed == 3 and peak == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_budget():
+    client = mock_client(lambda request: httpx.Response(404), cache=MemoryCache())
+    refresher = RefreshScheduler(client, budget=2)
+    assert refresher._take_token(refresher._refilled) == 0
+    assert refresher._take_token(refresher._refilled) == 0
+    assert refresher._take_token(refresher._refilled) == pytest.approx(0.5)
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from companion_client.model.enum import ArtifactType, MaterialType
+from companion_client.model.similarity_search import DocumentChunk
+from companion_client.rerank import merge, rerank, to_arrays
+from companion_client.test.data import course_description as course
+
+
+def chunk(qid: str | None, pos: int | None, pos_end: int | None, score: float,
+          material_type: MaterialType | ArtifactType = MaterialType.SLIDES) -> DocumentChunk:
+    return DocumentChunk(qid=qid, pos=pos, pos_end=pos_end, similarity_score=score,
+                         course="MOD", material_type=material_type)
+
+
+def test_merge_overlapping_ranges():
+    chunks = [chunk("ci:1", 0, 10, 0.5), chunk("ci:1", 5, 20, 0.9), chunk("ci:1", 30, 40, 0.7),
+              chunk("ci:2", 0, 10, 0.6), chunk(None, None, None, 0.4)]
+    a = to_arrays(chunks)
+    seg = merge(a, a.score)
+    merged = {int(r): (int(p), int(e), int(s)) for r, p, e, s in zip(seg.representative, seg.pos, seg.pos_end, seg.size)}
+    assert merged == {1: (0, 20, 2), 2: (30, 40, 1), 3: (0, 10, 1), 4: (0, 0, 1)}
+
+
+def test_rerank_top_k_and_threshold():
+    chunks = [chunk("ci:1", 0, 10, 0.5), chunk("ci:1", 5, 20, 0.9), chunk("ci:2", 0, 10, 0.6),
+              chunk("qa:1", 0, 1, 0.8, ArtifactType.QA), chunk("ci:3", 0, 1, 0.1)]
+    result = rerank(chunks, course(max_sources_display=2, max_score_sources_display=0.2))
+    assert [(c.qid, c.pos, c.pos_end) for c in result.display] == [("ci:1", 0, 20), ("qa:1", 0, 1)]
+    assert [c.qid for c in result.context] == ["ci:1", "qa:1", "ci:2", "ci:3"]
+
+
+def test_rerank_material_type_weight():
+    chunks = [chunk("ci:1", 0, 10, 0.5), chunk("qa:1", 0, 1, 0.8, ArtifactType.QA)]
+    result = rerank(chunks, course(reranking_strategy="material_type", material_type_weight=2.0))
+    assert [c.qid for c in result.display] == ["ci:1", "qa:1"]
+
+
+@pytest.mark.parametrize("n", [1000])
+def test_rerank_fast(n: int):
+    chunks = [chunk(f"ci:{i % 300}", (i * 7) % 1000, (i * 7) % 1000 + 50, (i * 31 % 97) / 97) for i in range(n)]
+    description = course()
+    timings = []
+    for _ in range(10):
+        start = time.perf_counter()
+        rerank(chunks, description)
+        timings.append(time.perf_counter() - start)
+    assert min(timings) < 0.001
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from companion_client.client import CompanionClient
+from companion_client.model.chat import ChatStreamingResponse, ChatStreamingResponseEnd, ChatStreamingSourcesResponse
+from companion_client.model.similarity_search import DocumentChunk
+from companion_client.resolver import MaterialResolver
+from companion_client.test.data import Clock, material, mock_client
+
+
+def material_client(requested: list[str], fail: set[str] = set(), malformed: set[str] = set()) -> CompanionClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        await asyncio.sleep(0.01)
+        i = int(request.url.path.rsplit("/", 1)[1])
+        if request.url.path in fail:
+            return httpx.Response(404)
+        if request.url.path in malformed:
+            return httpx.Response(200, text=json.dumps({"id": i}))
+        return httpx.Response(200, text=json.dumps(material(i)))
+
+    client = mock_client(handler)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_sources_are_resolved_in_background():
+    requested: list[str] = []
+    clock = Clock()
+    resolver = MaterialResolver(material_client(requested, fail={"/v1/material/cis/3"},
+                                                malformed={"/v1/material/cis/4"}), concurrency=2, clock=clock)
+    event = ChatStreamingSourcesResponse(value=[DocumentChunk(qid=q, course="MOD")
+                                                for q in ("cis:1", "cis:2", "cis:1", "cis:3", "cis:4", "qa:7")])
+    qids = resolver.observe(event)
+    assert qids == {"cis:1", "cis:2", "cis:3", "cis:4"}
+    assert resolver.observe(ChatStreamingResponseEnd()) == set()
+
+    resolved = await resolver.wait(qids)
+    assert sorted(resolved) == ["cis:1", "cis:2"]
+    assert sorted(requested) == ["/v1/material/cis/1", "/v1/material/cis/2", "/v1/material/cis/3",
+                                 "/v1/material/cis/4"]
+    assert [c.material.id if c.material else None
+            for c in resolver.resolve_chunks(event.value)] == [1, 2, 1, None, None, None]
+
+    # Failed lookups are not repeated within failure_ttl
+    resolver.observe(event)
+    await resolver.wait(qids)
+    assert len(requested) == 4
+    clock.now += 61
+    resolver.observe(event)
+    await resolver.wait(qids)
+    assert len(requested) == 6
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_fetch():
+    requested: list[str] = []
+    resolver = MaterialResolver(material_client(requested))
+    qids = resolver.schedule(["cis:1"])
+    first = asyncio.create_task(resolver.wait(qids))
+    second = asyncio.create_task(resolver.wait(qids))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert list(await second) == ["cis:1"] and requested == ["/v1/material/cis/1"]
+
+
+@pytest.mark.asyncio
+async def test_materials_referenced_by_qid():
+    requested: list[str] = []
+    resolver = MaterialResolver(material_client(requested))
+    event = ChatStreamingResponse.parse(json.dumps(
+        {"type": "materials", "value": [{"qid": "cis:1"}, material(2),
+                                        {"title": "Week 1", "materials": [{"qid": "cis:3"}]}]}))
+    qids = resolver.observe(event)
+    assert qids == {"cis:1", "cis:2", "cis:3"}
+    assert sorted(await resolver.wait(qids)) == ["cis:1", "cis:2", "cis:3"]
+    assert sorted(requested) == ["/v1/material/cis/1", "/v1/material/cis/3"]
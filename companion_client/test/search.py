@@ -0,0 +1,55 @@
+import time
+
+from companion_client.model.course_structure import CourseTopic, Section
+from companion_client.search import SearchIndex, build_index, section_key, topic_key
+
+
+def test_search_ranks_and_prefix_matches():
+    index = build_index(topics=[CourseTopic(id="uml", title_de="Klassendiagramme", title_en="Class diagrams"),
+                                CourseTopic(id="bpmn", title_de="Geschäftsprozesse", title_en="Business processes")],
+                        sections=[Section(seqno=1, seqno_padded="01", seqnos=[1], title_short_de="Einführung",
+                                          description_de="Überblick über Diagramme")])
+    assert [h.key for h in index.search("diagrams")] == ["topic:uml"]
+    assert [h.key for h in index.search("diag")] == ["topic:uml", "section:1"]
+    assert [h.key for h in index.search("geschafts")] == ["topic:bpmn"]
+    assert index.search("diag ", prefix=True) == []
+
+
+def test_incremental_update_and_serialization():
+    topic = CourseTopic(id="uml", title_de="Klassendiagramme", title_en="Class diagrams")
+    index = build_index(topics=[topic])
+    index.add_topic(topic.model_copy(update={"title_en": "Sequence diagrams"}))
+    assert len(index) == 1
+    assert index.search("class") == []
+
+    copy = SearchIndex.loads(index.dumps())
+    assert copy.search("seq") == index.search("seq")
+    copy.remove(topic_key(topic))
+    assert copy.search("seq") == []
+
+
+def lectures(index: SearchIndex, title: str = "Vorlesung") -> None:
+    for i in range(2000):
+        index.add(f"ci:{i}", title=(f"{title} {i} Modellierung Teil {i % 17}",), text=(f"Folien zu Thema {i % 50}",))
+
+
+def test_type_ahead_latency():
+    index = SearchIndex()
+    lectures(index)
+    queries = [f"teil 3 {prefix}" for prefix in ("m", "mo", "mod", "mode", "t", "1")] * 20
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q)
+    assert (time.perf_counter() - start) / len(queries) < 0.001
+    assert section_key(Section(seqno=2, seqno_padded="02", seqnos=[2])) == "section:2"
+
+
+def test_updates_reuse_ids():
+    index = SearchIndex()
+    lectures(index)
+    lectures(index, title="Übung")
+    assert len(index) == len(index._keys) == 2000
+    assert index.search("vorlesung") == [] and len(index.search("ubung", limit=2000)) == 2000
+    index.remove("ci:5")
+    index.add("ci:new", title=("Vorlesung",))
+    assert len(index._keys) == 2000 and [h.key for h in index.search("vorl")] == ["ci:new"]
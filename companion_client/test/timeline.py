@@ -0,0 +1,50 @@
+import pendulum
+
+from companion_client.model.course_structure import CourseInstanceSlot
+from companion_client.model.enum import SlotType
+from companion_client.model.query import SlotQuery
+from companion_client.timeline import SlotTimeline
+
+
+def slot(i: int, start: str | None, slot_type: str = "lecture", groups: list[str] | None = None) -> CourseInstanceSlot:
+    return CourseInstanceSlot(id=i, course="MOD", semester="2024-WS", start=start, groups=groups,
+                              slot_type={"id": slot_type, "title_short_de": "", "title_short_en": "",
+                                         "title_long_de": "", "title_long_en": ""})
+
+
+def timeline() -> SlotTimeline:
+    return SlotTimeline([slot(3, "2024-10-15T10:00:00+02:00", "tutorial", ["a"]),
+                         slot(1, "2024-10-01T10:00:00+02:00"),
+                         slot(2, "2024-10-08T10:00:00+02:00", groups=["b"]),
+                         slot(4, "2024-10-22T10:00:00+02:00"),
+                         slot(5, None)])
+
+
+def test_recent_and_upcoming():
+    t = timeline()
+    now = pendulum.parse("2024-10-15T11:00:00+02:00")
+    assert [s.id for s in t.recent(now=now)] == [3, 2, 1]
+    assert [s.id for s in t.upcoming(now=now)] == [4]
+    assert [s.id for s in t.current(now=now)] == [3]
+    assert [s.id for s in t.recent(SlotQuery(slot_type=SlotType.LECTURE, limit=1), now=now)] == [2]
+    assert [s.id for s in t.recent(SlotQuery(group="a"), now=now)] == [3, 1]
+    assert t.unscheduled[0].id == 5
+
+
+def test_between_and_boundaries():
+    t = timeline()
+    assert [s.id for s in t.between(pendulum.parse("2024-10-08"), pendulum.parse("2024-10-16"))] == [2, 3]
+    now = pendulum.parse("2024-10-15T11:00:00+02:00")
+    assert t.next_boundary(now) == pendulum.parse("2024-10-15T11:30:00+02:00")
+    assert t.next_boundary(pendulum.parse("2024-10-15T12:00:00+02:00")) == pendulum.parse("2024-10-22T10:00:00+02:00")
+
+
+def test_upsert_notifies():
+    t = timeline()
+    changes = []
+    t.add_listener(lambda _: changes.append(len(t)))
+    t.upsert(slot(2, "2024-10-30T10:00:00+02:00"))
+    t.remove(4)
+    now = pendulum.parse("2024-10-20T00:00:00+02:00")
+    assert [s.id for s in t.upcoming(now=now)] == [2]
+    assert changes == [5, 4]
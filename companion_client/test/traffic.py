@@ -0,0 +1,95 @@
+import io
+import json
+
+import httpx
+import pytest
+
+from companion_client.answer_cache import AnswerCache
+from companion_client.cache import MemoryCache
+from companion_client.chat_client import CompanionChatClient
+from companion_client.model.chat import ChatStreamingChunkResponse, ChatStreamingResponseEnd, StreamingResponseType
+from companion_client.test.data import FakeSocket, chat_request, mock_client
+from companion_client.traffic import RECORD_ADAPTER, ChatCall, RestCall, TrafficRecorder, percentile, replay
+
+
+def stand_in(calls: list[str]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404)
+        return httpx.Response(200, text=json.dumps(["2024-WS"]))
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay_rest():
+    sink = io.StringIO()
+    recorder = TrafficRecorder(sink)
+    client = mock_client(stand_in([]), recorder=recorder)
+    await client.get_semesters()
+    with pytest.raises(httpx.HTTPStatusError):
+        await client._get("/missing")
+
+    records = [RECORD_ADAPTER.validate_json(line) for line in sink.getvalue().splitlines()]
+    assert [(r.path, r.status) for r in records] == [("/semesters", 200), ("/missing", 404)]
+
+    calls: list[str] = []
+    report = await replay(records, "http://stand-in.test/v1", speedup=100, transport=stand_in(calls))
+    assert calls == ["http://stand-in.test/v1/semesters", "http://stand-in.test/v1/missing"]
+    assert report.requests == 2 and report.errors == 1 and report.latency["rest"]["p50"] is not None
+
+
+def test_chat_ids_are_anonymized():
+    recorder = TrafficRecorder(salt=b"salt")
+    recorder.record_chat(0.0, chat_request("hello"), ttft=0.2, events=5, response_bytes=100)
+    recorder.record_chat(1.0, chat_request("again"), ttft=0.1, events=5, response_bytes=100)
+    first, second = recorder.records
+    assert isinstance(first, ChatCall) and first.request["user_id"] != "u1"
+    assert first.request["thread_id"] == second.request["thread_id"]
+    assert isinstance(RECORD_ADAPTER.validate_json(first.model_dump_json()), ChatCall)
+    assert not isinstance(first, RestCall)
+
+
+@pytest.mark.asyncio
+async def test_chat_ending_at_end_is_not_an_error(monkeypatch):
+    FakeSocket([ChatStreamingChunkResponse(value="hi").model_dump_json(),
+                ChatStreamingResponseEnd().model_dump_json()]).connect(monkeypatch)
+    recorder = TrafficRecorder()
+    chat = CompanionChatClient("http://companion.test/v1", compression=False, recorder=recorder)
+    stream = chat.chat(chat_request("hello"))
+    async for rsp in stream:
+        if rsp.type == StreamingResponseType.END:
+            break
+    await stream.aclose()
+    (call,) = recorder.records
+    assert isinstance(call, ChatCall) and call.events == 2 and not call.error
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_are_recorded(monkeypatch):
+    recorder = TrafficRecorder()
+    client = mock_client(stand_in([]), recorder=recorder, cache=MemoryCache())
+    await client.get_semesters()
+    await client.get_semesters()
+    assert [(r.path, r.cached) for r in recorder.records] == [("/semesters", False), ("/semesters", True)]
+
+    events = [ChatStreamingChunkResponse(value="hi"), ChatStreamingResponseEnd()]
+    answers = AnswerCache()
+    answers.put(chat_request("hello"), events, [0.0, 0.0])
+    chat = CompanionChatClient("http://companion.test/v1", answer_cache=answers, recorder=recorder)
+    assert [e async for e in chat.chat(chat_request("hello"))] == events
+    call = recorder.records[-1]
+    assert isinstance(call, ChatCall) and call.cached and call.events == 2 and not call.error
+
+
+@pytest.mark.asyncio
+async def test_replay_counts_chat_failures():
+    recorder = TrafficRecorder()
+    recorder.record_chat(0.0, chat_request("hello"), ttft=0.1, events=2, response_bytes=10)
+    report = await replay(recorder.records, "http://stand-in.test/v1", transport=stand_in([]))
+    assert report.errors == 1 and sum(report.exceptions.values()) == 1
+
+
+def test_percentile():
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile([], 99) is None
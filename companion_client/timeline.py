@@ -0,0 +1,192 @@
+import asyncio
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+import pendulum
+from pendulum import DateTime
+
+from companion_client.model.course_structure import CourseInstanceSlot
+from companion_client.model.query import SlotQuery, canonical
+
+if TYPE_CHECKING:
+    from companion_client.client import CompanionClient
+
+type Listener = Callable[["SlotTimeline"], None]
+
+
+def slot_start(slot: CourseInstanceSlot) -> DateTime | None:
+    return pendulum.parse(slot.start) if slot.start else None  # type: ignore[return-value]
+
+
+def _values(value) -> set | None:
+    c = canonical(value)
+    if c is None:
+        return None
+    return set(c) if isinstance(c, tuple) else {c}
+
+
+def matches(slot: CourseInstanceSlot, q: SlotQuery | None) -> bool:
+    """ Evaluates the filters of a SlotQuery (except limit and offset) on a slot """
+    if q is None:
+        return True
+    if q.course is not None and slot.course.upper() != q.course:
+        return False
+    if q.semester is not None and slot.semester != q.semester:
+        return False
+    if (groups := _values(q.group)) is not None and slot.groups and not groups.intersection(slot.groups):
+        return False
+    if (types := _values(q.slot_type)) is not None and slot.slot_type.id not in types:
+        return False
+    if (seqnos := _values(q.seqno)) is not None and slot.seqno not in seqnos:
+        return False
+    if (topics := _values(q.topic)) is not None and not topics.intersection(t.id for t in slot.topics or ()):
+        return False
+    if q.start_date is not None or q.end_date is not None:
+        start = slot_start(slot)
+        if start is None:
+            return False
+        if q.start_date is not None and start < q.start_date:
+            return False
+        if q.end_date is not None and start > q.end_date:
+            return False
+    return True
+
+
+class SlotTimeline:
+    """
+    All slots of a course instance, sorted by start, answering recent, upcoming,
+    current and date range questions locally by binary search.
+    Slots without a start date are kept in unscheduled.
+    """
+
+    def __init__(self, slots: Iterable[CourseInstanceSlot] = (), duration: timedelta = timedelta(minutes=90)):
+        self.duration = duration.total_seconds()
+        self.unscheduled: list[CourseInstanceSlot] = []
+        self._starts: list[float] = []
+        self._slots: list[CourseInstanceSlot] = []
+        self._listeners: list[Listener] = []
+        self.update(slots)
+
+    def __len__(self) -> int:
+        return len(self._slots) + len(self.unscheduled)
+
+    def __iter__(self) -> Iterator[CourseInstanceSlot]:
+        return iter(self._slots)
+
+    def add_listener(self, listener: Listener) -> None:
+        """ Called when the slot set changes and when a slot starts or ends """
+        self._listeners.append(listener)
+
+    def _changed(self) -> None:
+        for listener in self._listeners:
+            listener(self)
+
+    def update(self, slots: Iterable[CourseInstanceSlot]) -> None:
+        """ Replaces all slots """
+        scheduled = []
+        self.unscheduled = []
+        for slot in slots:
+            start = slot_start(slot)
+            if start is None:
+                self.unscheduled.append(slot)
+            else:
+                scheduled.append((start.timestamp(), slot))
+        scheduled.sort(key=lambda x: x[0])
+        self._starts = [s for s, _ in scheduled]
+        self._slots = [slot for _, slot in scheduled]
+        self._changed()
+
+    def upsert(self, slot: CourseInstanceSlot) -> None:
+        self._remove(slot.id)
+        start = slot_start(slot)
+        if start is None:
+            self.unscheduled.append(slot)
+        else:
+            i = bisect_right(self._starts, start.timestamp())
+            self._starts.insert(i, start.timestamp())
+            self._slots.insert(i, slot)
+        self._changed()
+
+    def remove(self, slot_id: int) -> None:
+        self._remove(slot_id)
+        self._changed()
+
+    def _remove(self, slot_id: int) -> None:
+        self.unscheduled = [s for s in self.unscheduled if s.id != slot_id]
+        for i, s in enumerate(self._slots):
+            if s.id == slot_id:
+                del self._slots[i]
+                del self._starts[i]
+                return
+
+    @staticmethod
+    def _now(now: DateTime | None) -> float:
+        return (now or pendulum.now()).timestamp()
+
+    def recent(self, q: SlotQuery | None = None, now: DateTime | None = None) -> list[CourseInstanceSlot]:
+        """ Slots that have started, most recent first """
+        end = bisect_right(self._starts, self._now(now))
+        return self._collect(range(end - 1, -1, -1), q)
+
+    def upcoming(self, q: SlotQuery | None = None, now: DateTime | None = None) -> list[CourseInstanceSlot]:
+        """ Slots that have not started yet, earliest first """
+        start = bisect_right(self._starts, self._now(now))
+        return self._collect(range(start, len(self._slots)), q)
+
+    def current(self, q: SlotQuery | None = None, now: DateTime | None = None) -> list[CourseInstanceSlot]:
+        """ Slots in progress """
+        t = self._now(now)
+        lo = bisect_right(self._starts, t - self.duration)
+        return self._collect(range(lo, bisect_right(self._starts, t)), q)
+
+    def between(self, start: DateTime, end: DateTime, q: SlotQuery | None = None) -> list[CourseInstanceSlot]:
+        """ Slots starting in [start, end) """
+        lo = bisect_left(self._starts, start.timestamp())
+        hi = bisect_left(self._starts, end.timestamp())
+        return self._collect(range(lo, hi), q)
+
+    def _collect(self, indices: range, q: SlotQuery | None) -> list[CourseInstanceSlot]:
+        result = []
+        limit = q.limit if q is not None else None
+        for i in indices:
+            if matches(self._slots[i], q):
+                result.append(self._slots[i])
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    def next_boundary(self, now: DateTime | None = None) -> DateTime | None:
+        """ The next time a slot starts or ends """
+        t = self._now(now)
+        i = bisect_right(self._starts, t)
+        candidates = [self._starts[i]] if i < len(self._starts) else []
+        j = bisect_right(self._starts, t - self.duration)
+        if j < len(self._starts) and self._starts[j] <= t:
+            candidates.append(self._starts[j] + self.duration)
+        return pendulum.from_timestamp(min(candidates)) if candidates else None
+
+    async def watch(self, client: "CompanionClient", course: str, semester: str,
+                    refresh_interval: timedelta = timedelta(minutes=15)) -> None:
+        """
+        Keeps the timeline current until cancelled: refetches the slots every
+        refresh_interval and notifies listeners whenever a slot starts or ends.
+        """
+        q = SlotQuery(course=course, semester=semester)
+        refresh_at = pendulum.now() + refresh_interval
+        while True:
+            now = pendulum.now()
+            if now >= refresh_at:
+                slots = sorted(await client.get_slots(q), key=lambda s: s.id)
+                if [s.model_dump() for s in slots] != [s.model_dump() for s in self._all()]:
+                    self.update(slots)
+                refresh_at = now + refresh_interval
+            boundary = self.next_boundary(now)
+            wake = refresh_at if boundary is None else min(boundary, refresh_at)
+            await asyncio.sleep(max((wake - now).total_seconds(), 0.0))
+            if boundary is not None and boundary <= wake:
+                self._changed()
+
+    def _all(self) -> Sequence[CourseInstanceSlot]:
+        return sorted([*self._slots, *self.unscheduled], key=lambda s: s.id)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Annotated, Any, Literal, TextIO
+
+import httpx
+from httpx_ws import aconnect_ws
+from pydantic import BaseModel, Field, TypeAdapter
+
+from companion_client.model.chat import ChatStreamingRequest, ChatStreamingResponse, StreamingResponseType
+
+ANONYMIZED_FIELDS = ("user_id", "thread_id", "req_id")
+
+
+class RestCall(BaseModel, frozen=True):
+    kind: Literal["rest"] = "rest"
+    at: float
+    """ Seconds since the start of the recording """
+    method: str
+    path: str
+    params: Mapping[str, Any] = {}
+    status: int
+    duration: float
+    response_bytes: int
+    cached: bool = False
+    """ Served from the response cache, without a request to the API """
+
+
+class ChatCall(BaseModel, frozen=True):
+    kind: Literal["chat"] = "chat"
+    at: float
+    request: Mapping[str, Any]
+    """ The ChatStreamingRequest with anonymized user, thread and request ids """
+    duration: float
+    ttft: float | None
+    """ Time to the first streamed token """
+    events: int
+    response_bytes: int
+    error: bool = False
+    cached: bool = False
+    """ Replayed from the answer cache, without a request to the API """
+
+
+type TrafficRecord = Annotated[RestCall | ChatCall, Field(discriminator="kind")]
+RECORD_ADAPTER: TypeAdapter[TrafficRecord] = TypeAdapter(TrafficRecord)
+
+
+class TrafficRecorder:
+    """
+    Captures the calls made through CompanionClient and CompanionChatClient,
+    including those served from their caches (marked cached), so that a replay
+    reproduces the full load. Records are kept in memory and, with a sink,
+    written as JSON lines.
+    Ids are replaced by keyed hashes, consistently within a recording.
+    """
+
+    def __init__(self, sink: TextIO | None = None, salt: bytes | None = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.sink = sink
+        self.records: list[TrafficRecord] = []
+        self._salt = salt if salt is not None else os.urandom(16)
+        self._clock = clock
+        self._start = clock()
+
+    def now(self) -> float:
+        return self._clock() - self._start
+
+    def anonymize(self, value: str) -> str:
+        return "anon-" + hmac.new(self._salt, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def _add(self, record: TrafficRecord) -> None:
+        self.records.append(record)
+        if self.sink is not None:
+            self.sink.write(record.model_dump_json() + "\n")
+
+    def record_rest(self, at: float, method: str, path: str, params: Mapping[str, Any] | None,
+                    status: int, response_bytes: int, cached: bool = False) -> None:
+        self._add(RestCall(at=at, method=method, path=path, params=dict(params or {}), status=status,
+                           duration=self.now() - at, response_bytes=response_bytes, cached=cached))
+
+    def record_chat(self, at: float, request: ChatStreamingRequest, ttft: float | None, events: int,
+                    response_bytes: int, error: bool = False, cached: bool = False) -> None:
+        data = request.model_dump(mode="json")
+        for name in ANONYMIZED_FIELDS:
+            data[name] = self.anonymize(data[name])
+        self._add(ChatCall(at=at, request=data, duration=self.now() - at, ttft=ttft, events=events,
+                           response_bytes=response_bytes, error=error, cached=cached))
+
+
+def load(path: str | Path) -> list[TrafficRecord]:
+    with open(path) as f:
+        return [RECORD_ADAPTER.validate_json(line) for line in f if line.strip()]
+
+
+@dataclass
+class Result:
+    kind: str
+    latency: float
+    ok: bool
+    ttft: float | None = None
+    response_bytes: int = 0
+    error: str | None = None
+    """ The exception that failed the call, if any """
+
+
+def percentile(values: Sequence[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+@dataclass
+class Report:
+    requests: int
+    errors: int
+    wall_seconds: float
+    throughput: float
+    latency: dict[str, dict[str, float | None]] = field(default_factory=dict)
+    ttft: dict[str, float | None] = field(default_factory=dict)
+    exceptions: dict[str, int] = field(default_factory=dict)
+    """ Calls that failed with an exception, by exception type """
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self) | {"error_rate": self.error_rate}
+
+
+def summarize(results: Sequence[Result], wall_seconds: float) -> Report:
+    def stats(values: Sequence[float]) -> dict[str, float | None]:
+        return {f"p{p}": percentile(values, p) for p in (50, 90, 99)} | {"max": max(values, default=None)}
+
+    kinds = sorted({r.kind for r in results})
+    return Report(requests=len(results),
+                  errors=sum(not r.ok for r in results),
+                  wall_seconds=wall_seconds,
+                  throughput=len(results) / wall_seconds if wall_seconds else 0.0,
+                  latency={k: stats([r.latency for r in results if r.kind == k]) for k in kinds},
+                  ttft=stats([r.ttft for r in results if r.ttft is not None]),
+                  exceptions=dict(Counter(r.error for r in results if r.error is not None)))
+
+
+async def _replay_rest(http: httpx.AsyncClient, record: RestCall) -> Result:
+    start = time.monotonic()
+    try:
+        r = await http.request(record.method, record.path, params=record.params)
+        return Result("rest", time.monotonic() - start, r.is_success, response_bytes=len(r.content))
+    except httpx.HTTPError as e:
+        return Result("rest", time.monotonic() - start, False, error=type(e).__name__)
+
+
+async def _replay_chat(http: httpx.AsyncClient, base_url: str, record: ChatCall) -> Result:
+    start = time.monotonic()
+    ttft = None
+    size = 0
+    ok = False
+    error = None
+    try:
+        async with aconnect_ws(f"{base_url}/chat/ws", http) as ws:
+            await ws.send_text(json.dumps(record.request))
+            while True:
+                message = await ws.receive_text()
+                size += len(message)
+                rsp = ChatStreamingResponse.parse(message)
+                if rsp.type == StreamingResponseType.STREAMING and ttft is None:
+                    ttft = time.monotonic() - start
+                if rsp.type == StreamingResponseType.ERROR:
+                    break
+                if rsp.type == StreamingResponseType.END:
+                    ok = True
+                    break
+    except Exception as e:
+        error = type(e).__name__
+    return Result("chat", time.monotonic() - start, ok, ttft, size, error)
+
+
+async def replay(records: Iterable[TrafficRecord], base_url: str, speedup: float = 1.0,
+                 concurrency: int = 256, token: str = "",
+                 transport: httpx.AsyncBaseTransport | None = None) -> Report:
+    """
+    Replays records against base_url, keeping their relative timing compressed by
+    speedup. At most concurrency calls are outstanding; later calls queue up.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    results: list[Result] = []
+
+    async def run(record: TrafficRecord) -> None:
+        async with semaphore:
+            if isinstance(record, RestCall):
+                results.append(await _replay_rest(http, record))
+            else:
+                results.append(await _replay_chat(http, base_url, record))
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, transport=transport) as http:
+        start = time.monotonic()
+        tasks = []
+        for record in sorted(records, key=lambda r: r.at):
+            delay = start + record.at / speedup - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(run(record)))
+        await asyncio.gather(*tasks)
+        return summarize(results, time.monotonic() - start)